@@ -2,332 +2,220 @@
 
 This implementation uses numpy arrays to represent vectors for efficient computation
 of flocking behavior.
+
+Every WEC shares the same core, ``SwarmAgent``; what changes between the
+models is the ``DirectionPolicy`` deciding where a WEC heads when it is not
+escaping a crowd: towards the neighbor with the highest power (``WEC``),
+towards the maximum of a GP surrogate of the neighbors' power (``GP``), or
+nowhere because it is moored (``STATIC``).
+
+The state of the agents is not kept in the agent objects: every scalar
+attribute (battery, power, speed, ...) is a row of a typed array of the
+model's ``AgentArrays``, next to ``model.directions`` and
+``model.agent_angles``, and the neighbors are stored as rows of the space.
+An agent is a thin ``__slots__`` view over its row of the space, so the
+attributes read as before for the reporters and the visualization while the
+``SwarmEngine``, the collector and the checkpoints work on whole arrays.
 """
 
 import numpy as np
 
 from mesa.experimental.continuous_space import ContinuousSpaceAgent
-from mesa import DataCollector
 
 from direction import get_direction as dir
 from separation import separation
 
-class WEC(ContinuousSpaceAgent):
-    """A Boid-style flocker agent.
 
-    The agent follows three behaviors to flock:
-        - Cohesion: steering towards neighboring agents
-        - Separation: avoiding getting too close to any other agent
-        - Alignment: trying to fly in the same direction as neighbors
+# per-agent scalar state, one array of this dtype per field in ``AgentArrays``
+AGENT_FIELDS = {
+    "max_speed": np.float64,
+    "speed": np.float64,
+    "vision": np.float64,
+    "separation": np.float64,
+    "min_separation": np.float64,
+    "power": np.float64,
+    "battery": np.float64,
+    "consume": np.float64,
+    "efficiency": np.float64,
+    "WEC_power": np.float64,
+    "load": np.float64,
+    "energy_harvested": np.float64,
+    "mean_energy_harvested": np.float64,
+    "total_energy_harvested": np.float64,
+    "step_number": np.int64,
+    "count_agent_in_zone": np.int64,
+    "n_neighbors": np.int64,
+}
+
+
+class AgentArrays:
+    """State of the agents of a model, one typed array per field of ``AGENT_FIELDS``.
+
+    Row ``k`` belongs to the agent in row ``k`` of the space
+    (``space._agent_to_index``); ``directions`` and ``angles`` hold the
+    direction of movement and the heading of every agent. The arrays follow
+    the rows of the space: ``ensure`` makes room for the agents placed after
+    the model was built, ``delete`` closes the gap an agent removed from the
+    space leaves, like ``ContinuousSpace._remove_agent`` does for the
+    positions. Both replace the attributes, which are views of the first
+    ``size`` rows of a storage grown by doubling.
+
+    The neighbors of all the rows are stored concatenated, as rows of the
+    space and distances, row ``k`` owning
+    ``neighbor_offsets[k]:neighbor_offsets[k + 1]`` of them; the first
+    time a single row is replaced (agents sensing one after the other) they
+    are split into one pair of arrays per row.
+
+    Args:
+        size: Number of agents of the model
+    """
 
-    Boids have a vision that defines the radius in which they look for their
-    neighbors to flock with. Their speed (a scalar) and direction (a vector)
-    define their movement. Separation is their desired minimum distance from
-    any other Boid.
+    def __init__(self, size):
+        self.storage = {name: np.zeros(size, dtype=dtype) for name, dtype in AGENT_FIELDS.items()}
+        self.storage["directions"] = np.zeros((size, 2))
+        self.storage["angles"] = np.zeros(size)
+        self.capacity = size
+        self.size = size
+        self.view()
+        self.set_neighbors(np.zeros(size, dtype=np.int64), np.empty(0, dtype=np.intp), np.empty(0))
+
+    def __len__(self):
+        return self.size
+
+    def view(self):
+        for name, array in self.storage.items():
+            setattr(self, name, array[: self.size])
+
+    def ensure(self, size):
+        """Make room for ``size`` rows; the new rows start at zero, without neighbors."""
+        if size <= self.size:
+            return
+        if size > self.capacity:
+            self.capacity = max(size, 2 * self.capacity)
+            for name, array in self.storage.items():
+                grown = np.zeros((self.capacity, *array.shape[1:]), dtype=array.dtype)
+                grown[: self.size] = array[: self.size]
+                self.storage[name] = grown
+        else:
+            for array in self.storage.values():
+                array[self.size:size] = 0
+        counts, rows, distances = self.neighbor_table()
+        self.size = size
+        self.view()
+        self.set_neighbors(np.concatenate([counts, np.zeros(size - len(counts), dtype=np.int64)]), rows, distances)
+
+    def delete(self, row):
+        """Remove row ``row``, the rows after it move up by one; neighbors are renumbered."""
+        counts, rows, distances = self.neighbor_table()
+        owners = np.repeat(np.arange(self.size), counts)
+        keep = (owners != row) & (rows != row)
+        owners, rows, distances = owners[keep], rows[keep], distances[keep]
+        owners -= owners > row
+        rows = rows - (rows > row)
+        for array in self.storage.values():
+            array[row:self.size - 1] = array[row + 1:self.size]
+        self.size -= 1
+        self.view()
+        self.set_neighbors(np.bincount(owners, minlength=self.size), rows, distances)
+
+    def set_neighbors(self, counts, rows, distances):
+        """Neighbors of every row at once, ``counts[k]`` of the concatenated ``rows`` and ``distances`` each."""
+        self.n_neighbors[:] = counts
+        self.neighbor_offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.neighbor_rows = rows
+        self.neighbor_distances = distances
+        self.split = None
+
+    def neighbors_of(self, k):
+        """Rows of the space and distances of the neighbors of row ``k``."""
+        if self.split is not None:
+            return self.split[0][k], self.split[1][k]
+        start, stop = self.neighbor_offsets[k], self.neighbor_offsets[k + 1]
+        return self.neighbor_rows[start:stop], self.neighbor_distances[start:stop]
+
+    def set_neighbors_of(self, k, rows, distances):
+        """Neighbors of the single row ``k``."""
+        if self.split is None:
+            bounds = self.neighbor_offsets[1:-1]
+            self.split = (np.split(self.neighbor_rows, bounds), np.split(self.neighbor_distances, bounds))
+        self.split[0][k] = rows
+        self.split[1][k] = distances
+        self.n_neighbors[k] = len(rows)
+
+    def neighbor_table(self):
+        """Counts, concatenated rows and concatenated distances of the neighbors of every row."""
+        if self.split is None:
+            return self.n_neighbors.copy(), self.neighbor_rows, self.neighbor_distances
+        return (
+            self.n_neighbors.copy(),
+            np.concatenate([*self.split[0], np.empty(0, dtype=np.intp)]).astype(np.intp),
+            np.concatenate([*self.split[1], np.empty(0)]),
+        )
+
+
+class AgentField:
+    """Attribute of a ``SwarmAgent`` stored in its row of ``model.agent_arrays``."""
+
+    __slots__ = ("name",)
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, agent, owner=None):
+        if agent is None:
+            return self
+        return getattr(agent.model.agent_arrays, self.name)[agent.space._agent_to_index[agent]]
+
+    def __set__(self, agent, value):
+        getattr(agent.model.agent_arrays, self.name)[agent.space._agent_to_index[agent]] = value
+
+
+class DirectionPolicy:
+    """Strategy choosing the direction of a WEC that seeks more power.
+
+    ``name`` selects the equivalent rule of the vectorized ``SwarmEngine``;
+    a policy that is not ``mobile`` never moves its agents.
     """
 
-    def __init__(
-        self,
-        model,
-        space,
-        position=(0, 0),
-        max_speed=0.1,
-        speed = 0,
-        direction=(1, 1),
-        vision=20,
-        separation=5,
-        power: float = 0,
-        battery: float = 30,
-        consume = 0.1,
-        efficiency: float = 0.6,
-        WEC_power = 0,
-        load = 0,
-        energy_harvested=0,
-        mean_energy_harvested = 0,
-        net_energy_harvested = 0,
-        step_number = 0,
-        population_size = 100,
-        total_energy_harvested = 0,
-        count_agent_in_zone = 0,
-        ):
-        """Create a new Boid flocker agent.
+    name = None
+    mobile = True
 
-        Args:
-            model: Model instance the agent belongs to
-            speed: Distance to move per step
-            direction: numpy vector for the Boid's direction of movement
-            vision: Radius to look around for nearby Boids
-            separation: Minimum distance to maintain from other Boids
-            cohere: Relative importance of matching neighbors' positions (default: 0.03)
-            separate: Relative importance of avoiding close neighbors (default: 0.015)
-            match: Relative importance of matching neighbors' directions (default: 0.05)
-        """
-        super().__init__(space, model)
-        self.position = position
-        self.max_speed = max_speed
-        self.speed = speed
-        self.direction = direction
-        self.vision = vision ## radius of comunication
-        self.separation = separation
-        self.min_separation  = separation
-        self.neighbors = []
-        self.angle = 0.0  # represents the angle at which the boid is moving
-        self.power = self.model.power.get_power(self.position)
-        self.battery = battery
-        self.consume = consume ## rate of usage of the battery to move
-        self.efficiency = efficiency
-        self.WEC_power = WEC_power
-        self.load = load
-        self.energy_harvested = energy_harvested
-        self.mean_energy_harvested = mean_energy_harvested
-        self.net_energy_harvested = net_energy_harvested
-        self.step_number = step_number
-        self.total_energy_harvested = total_energy_harvested
-        self.population_size = population_size
-        self.count_agent_in_zone = count_agent_in_zone
+    def direction(self, agent):
+        """Unit vector the agent heads to, given its current neighbors."""
+        raise NotImplementedError
 
-    def update_status(self):
-        self.neighbors, _ = self.get_neighbors_in_radius(radius=self.vision)
-        self.get_speed()
-        self.power = self.model.power.get_power(self.position)
-        self.get_battery()
-        self.energy_hervesting()
-        self.get_separation()
-        
 
+class TargetPolicy(DirectionPolicy):
+    """Head to the neighbor with the highest power."""
 
+    name = "target"
 
-    def step(self):
-        # get updates   
-        self.step_number += 1
-        self.zone_counting()
-        self.update_status() 
-            
-        self.neighbors = [n for n in self.neighbors if n is not self]
-        # If no neighbors, maintain current direction
-        if not self.neighbors:
-            self.move()
-            return
-        
-        #self.neighbors = [n for n in self.neighbors if n.power > self.power] # filtered neigbors visible only if they have major pawer then me
-        
-        self.get_direction()   
-        # Move boid
-        self.move() 
-        
-        
-    def get_direction(self):
-        crowd = self.crowd()
-        if len(crowd) == 0 or self.battery < 10:
-            targets = self.get_target() # highest power function, i go where the power is higher
-            delta = self.space.calculate_difference_vector(self.position, agents=targets)
-            delta = delta[0]
-            # Normalize direction vector
-            norm = np.linalg.norm(delta)
-            self.direction = np.divide(delta, norm)
-        elif len(crowd) > 0:
-            self.agoraphobic(crowd=crowd)
-        else:
-            self.direction = [0, 0]
-        #print("direction =", self.direction)
-        return
-    
-    def get_target(self):
-        target = self.neighbors[0]
-        for n in self.neighbors:
-            if self.model.power.get_power(n.position) > self.model.power.get_power(target.position):
-                target = n
-        return [target]
-    
-    def crowd(self):
-        crowd = []
-        for n in self.neighbors:
-            distance = self.space.calculate_distances(point=self.position, agents=[n])
-            if distance[0] < self.separation:
-                crowd.append(n)
-        return crowd
-    
-    def agoraphobic(self, crowd):
-        delta = self.space.calculate_difference_vector(self.position, agents=crowd)
+    def direction(self, agent):
+        targets = agent.get_target() # highest power function, i go where the power is higher
+        delta = agent.space.calculate_difference_vector(agent.position, agents=targets)
         delta = delta[0]
+        # Normalize direction vector
         norm = np.linalg.norm(delta)
-        self.direction = -np.divide(delta, norm)
-        return self.direction
-    
-    def get_recharge(self):
-        return np.multiply(self.efficiency, self.model.power.get_power(self.position))
-    
-    def get_speed(self):
-        #self.speed = np.multiply(np.divide(self.battery, 100), self.max_speed)
-        #self.speed = np.multiply(1 - np.divide(self.battery, 100), self.max_speed) # linear function, can be sigmoid or others
-        #self.speed = self.max_speed * (1 - np.log(self.battery + 1) / np.log(101))
-        self.speed = self.max_speed * (1 - ((60 - self.battery) ** 2)/3600) #quadratica normalizzata
-        if self.battery < 5:
-            self.speed = 0
-        return
-    
-    def get_consume(self):
-        if self.battery > 80:
-            self.load = 0.6
-            #self.consume = 0.35
-        elif self.battery < 20:
-            self.load = 0.1
-            #self.consume = 0.1
-            if self.battery < 5:
-                self.load = 0.05
-                #self.consume = 0.05
-        else:
-            self.load = 0.2 + np.pow((np.divide(self.battery, 100)-0.2), 2)
-            #self.consume = 0.2
-        if self.load < 0:
-            self.load = 0
-            #self.consume = 0.00
-        
-        return (self.speed ** 3) * self.consume + self.load
-    
-    def get_battery(self):
-        self.WEC_power = self.get_recharge() - self.get_consume()
-        self.battery += self.get_recharge() - self.get_consume()
-        if self.battery > 100:
-            self.battery = 100
-        if self.battery < 0:
-            self.battery = 0
-        return
-  
-    def get_separation(self):
-        #print("separation at step ", self.step_number," = ", self.separation)
-        neighbors_power = [self.model.power.get_power(n.position) for n in self.neighbors]
-        self.separation = separation(s_min=self.min_separation, agent_power=self.model.power.get_power(self.position), neighbours_power=neighbors_power)
-        return
+        return np.divide(delta, norm)
 
-        
-    def zone_counting(self):
-         
-        if self.position[0] > 40 and self.position[0] < 60 and self.position[1] > 40 and self.position[1] <60:
-           # print( "position: ", self.position)
-            self.count_agent_in_zone += 1
-            #print( "number of the agents in the zone: ", self.count_agent_in_zone)
-
-        
-            
-    
-    def energy_hervesting(self):
-
-        self.energy_harvested = self.model.power.get_power(self.position)
-
-        self.total_energy_harvested += self.energy_harvested     
-        neighbor_energies = [a.energy_harvested for a in self.neighbors]
-        self.mean_energy_harvested = np.mean(neighbor_energies)
-        #print("mean energy at step ",self.step_number," of neighbors = ", self.mean_energy_harvested)
-        
-    #    self.total_energy_harvested = (lambda m: np.sum([a.energy_harvested for a in m.agents]))(self.model)
-    #    print("total energy at step ",self.step_number," = ", self.total_energy_harvested)
-        
-        
-    def move(self):
-        position = self.position + self.direction * self.speed
-        if position[0] < self.space.x_min:
-            self.direction[0] = -self.direction[0]
-            position[0] = self.position[0] + self.direction[0] * self.speed
-        if position[0] > self.space.x_max:
-            self.direction[0] = -self.direction[0]
-            position[0] = self.position[0] + self.direction[0] * self.speed
-        if position[1] < self.space.y_min:
-            self.direction[1] = -self.direction[1]
-            position[1] = self.position[1] + self.direction[1] * self.speed
-        if position[1] > self.space.y_max:
-            self.direction[1] = -self.direction[1]
-            position[1] = self.position[1] + self.direction[1] * self.speed
-        self.position = position
-        return
 
+class GPPolicy(DirectionPolicy):
+    """Head to the maximum of the GP surrogate of the neighbors' power."""
 
-class STATIC(ContinuousSpaceAgent):
-
-    def __init__(
-        self,
-        model,
-        space,
-        position=(0, 0),
-        max_speed=0.1,
-        speed = 0,
-        direction=(1, 1),
-        vision=20,
-        separation=5,
-        power: float = 0,
-        battery: float = 30,
-        consume = 0.1,
-        efficiency: float = 0.6,
-        WEC_power = 0,
-        load = 0,
-        energy_harvested=0,
-        mean_energy_harvested = 0,
-        net_energy_harvested = 0,
-        step_number = 0,
-        population_size = 100,
-        total_energy_harvested = 0,
-        count_agent_in_zone = 0,
-        ):
-        """Create a new Boid flocker agent.
-
-        Args:
-            model: Model instance the agent belongs to
-            speed: Distance to move per step
-            direction: numpy vector for the Boid's direction of movement
-            vision: Radius to look around for nearby Boids
-            separation: Minimum distance to maintain from other Boids
-            cohere: Relative importance of matching neighbors' positions (default: 0.03)
-            separate: Relative importance of avoiding close neighbors (default: 0.015)
-            match: Relative importance of matching neighbors' directions (default: 0.05)
-        """
-        super().__init__(space, model)
-        self.position = position
-        self.max_speed = max_speed
-        self.speed = speed
-        self.direction = direction
-        self.vision = vision ## radius of comunication
-        self.separation = separation
-        self.min_separation  = separation
-        self.neighbors = []
-        self.angle = 0.0  # represents the angle at which the boid is moving
-        self.power = self.model.power.get_power(self.position)
-        self.battery = battery
-        self.consume = consume ## rate of usage of the battery to move
-        self.efficiency = efficiency
-        self.WEC_power = WEC_power
-        self.load = load
-        self.energy_harvested = energy_harvested
-        self.mean_energy_harvested = mean_energy_harvested
-        self.net_energy_harvested = net_energy_harvested
-        self.step_number = step_number
-        self.total_energy_harvested = total_energy_harvested
-        self.population_size = population_size
-        self.count_agent_in_zone = count_agent_in_zone
+    name = "gp"
 
-        
-    def update_status(self):
-        self.power = self.model.power.get_power(self.position)
-        self.load_calculation()
-       
-    def load_calculation(self):
-        self.load = np.multiply(self.efficiency, self.model.power.get_power(self.position))
+    def direction(self, agent):
+        return dir(agent, agent.neighbors, cache=agent.model.gp_cache)
 
-        return self.load
 
+class StaticPolicy(DirectionPolicy):
+    """Moored WEC: it only harvests the power where it was placed."""
 
-        
-    def energy_hervesting(self):
-        self.energy_harvested = self.model.power.get_power(self.position)
-        self.total_energy_harvested += self.model.power.get_power(self.position)
+    name = "static"
+    mobile = False
 
-        
-    def step(self):
-        # get updates
-        self.update_status()
-        self.energy_hervesting()
-        
 
-class GP(ContinuousSpaceAgent):
+class SwarmAgent(ContinuousSpaceAgent):
     """A Boid-style flocker agent.
 
     The agent follows three behaviors to flock:
@@ -339,8 +227,36 @@ class GP(ContinuousSpaceAgent):
     neighbors to flock with. Their speed (a scalar) and direction (a vector)
     define their movement. Separation is their desired minimum distance from
     any other Boid.
+
+    One step goes through the phases sense → battery → separation → steer →
+    move; the class attribute ``policy`` decides the steering.
     """
 
+    # the attributes set by Mesa's Agent, whose class has no __slots__: the
+    # __dict__ stays empty unless the agent gets its own ``policy``
+    __slots__ = ("model", "unique_id")
+
+    policy = TargetPolicy()
+
+    # state in the agent's row of model.agent_arrays
+    max_speed = AgentField()
+    speed = AgentField()
+    vision = AgentField() ## radius of comunication
+    separation = AgentField()
+    min_separation = AgentField()
+    power = AgentField()
+    battery = AgentField()
+    consume = AgentField() ## rate of usage of the battery to move
+    efficiency = AgentField()
+    WEC_power = AgentField()
+    load = AgentField()
+    energy_harvested = AgentField()
+    mean_energy_harvested = AgentField()
+    total_energy_harvested = AgentField()
+    step_number = AgentField()
+    count_agent_in_zone = AgentField()
+    n_neighbors = AgentField()
+
     def __init__(
         self,
         model,
@@ -359,14 +275,17 @@ class GP(ContinuousSpaceAgent):
         load = 0,
         energy_harvested=0,
         mean_energy_harvested = 0,
-        net_energy_harvested = 0,
         step_number = 0,
-        population_size = 100,
         total_energy_harvested = 0,
         count_agent_in_zone = 0,
+        policy=None,
         ):
         """Create a new Boid flocker agent.
 
+        The state is written to the agent's row of ``model.agent_arrays``
+        (``model.directions`` and ``model.agent_angles`` included), grown if
+        the model was built for fewer agents.
+
         Args:
             model: Model instance the agent belongs to
             speed: Distance to move per step
@@ -376,83 +295,127 @@ class GP(ContinuousSpaceAgent):
             cohere: Relative importance of matching neighbors' positions (default: 0.03)
             separate: Relative importance of avoiding close neighbors (default: 0.015)
             match: Relative importance of matching neighbors' directions (default: 0.05)
+            policy: DirectionPolicy of this agent (default: the one of the class)
         """
         super().__init__(space, model)
+        self.model.agent_arrays.ensure(self.space._n_agents)
+        if policy is not None:
+            self.policy = policy
         self.position = position
         self.max_speed = max_speed
         self.speed = speed
         self.direction = direction
-        self.vision = vision ## radius of comunication
+        self.vision = vision
         self.separation = separation
         self.min_separation  = separation
-        self.neighbors = []
         self.angle = 0.0  # represents the angle at which the boid is moving
         self.power = self.model.power.get_power(self.position)
         self.battery = battery
-        self.consume = consume ## rate of usage of the battery to move
+        self.consume = consume
         self.efficiency = efficiency
         self.WEC_power = WEC_power
         self.load = load
         self.energy_harvested = energy_harvested
         self.mean_energy_harvested = mean_energy_harvested
-        self.net_energy_harvested = net_energy_harvested
         self.step_number = step_number
         self.total_energy_harvested = total_energy_harvested
-        self.population_size = population_size
         self.count_agent_in_zone = count_agent_in_zone
-
-    def update_status(self):
-        self.neighbors, _ = self.get_neighbors_in_radius(radius=self.vision)
-        self.get_speed()
-        self.power = self.model.power.get_power(self.position)
-        self.get_battery()
-        self.energy_hervesting()
-        self.get_separation()
-        
-
-
+        self.model.agents_changed()
+
+    def remove(self):
+        """Remove the agent from the model and the space, and its row from the model's arrays."""
+        row = self.space._agent_to_index[self]
+        super().remove()
+        self.model.agent_arrays.delete(row)
+        self.model.agents_changed()
+
+    # --- state kept by the model ------------------------------------------
+
+    @property
+    def direction(self):
+        """Direction of movement, a view on this agent's row of ``model.directions``."""
+        return self.model.directions[self.space._agent_to_index[self]]
+
+    @direction.setter
+    def direction(self, value):
+        self.model.directions[self.space._agent_to_index[self]] = value
+
+    @property
+    def angle(self):
+        """Heading in degrees, this agent's entry of ``model.agent_angles``."""
+        return self.model.agent_angles[self.space._agent_to_index[self]]
+
+    @angle.setter
+    def angle(self, value):
+        self.model.agent_angles[self.space._agent_to_index[self]] = value
+
+    @property
+    def neighbor_rows(self):
+        """Rows of the space of the agents seen at the last sense."""
+        return self.model.agent_arrays.neighbors_of(self.space._agent_to_index[self])[0]
+
+    @property
+    def neighbor_distances(self):
+        """Distances of the neighbors seen at the last sense."""
+        return self.model.agent_arrays.neighbors_of(self.space._agent_to_index[self])[1]
+
+    @property
+    def neighbors(self):
+        """Agents seen at the last sense, in the order of the space."""
+        index_to_agent = self.space._index_to_agent
+        return [index_to_agent[k] for k in self.neighbor_rows]
 
     def step(self):
-        # get updates   
-        self.step_number += 1
-        self.zone_counting()
-        self.update_status() 
-            
-        self.neighbors = [n for n in self.neighbors if n is not self]
-        # If no neighbors, maintain current direction
-        if not self.neighbors:
-            self.move()
+        self.sense()
+        self.charge()
+        if not self.policy.mobile:
             return
-        
-        #self.neighbors = [n for n in self.neighbors if n.power > self.power] # filtered neigbors visible only if they have major pawer then me
-        
-        self.get_direction()   
+        self.get_separation()
+        # If no neighbors, maintain current direction
+        if self.n_neighbors:
+            self.steer()
         # Move boid
-        self.move() 
-        
-        
-    def get_direction(self):
+        self.move()
+
+    # --- phases -------------------------------------------------------------
+
+    def sense(self):
+        """Neighbors, speed and power at the current position."""
+        if self.policy.mobile:
+            self.step_number += 1
+            self.zone_counting()
+            rows, distances = self.model.spatial_index.neighbor_rows(self, radius=self.vision)
+            self.model.agent_arrays.set_neighbors_of(self.space._agent_to_index[self], rows, distances)
+            self.get_speed()
+        self.power = self.model.power_cache.get(self)
+
+    def charge(self):
+        """Battery (or load, for a moored WEC) and harvested energy."""
+        if self.policy.mobile:
+            self.get_battery()
+        else:
+            self.load_calculation()
+        self.energy_hervesting()
+
+    def steer(self):
         crowd = self.crowd()
         if len(crowd) == 0 or self.battery < 10:
-            self.direction = dir(self, self.neighbors)
-        elif len(crowd) > 0:
+            self.direction = self.policy.direction(self)
+        else:
             self.agoraphobic(crowd=crowd)
-        return
-    
+
+    # --- rules --------------------------------------------------------------
+
     def get_target(self):
         target = self.neighbors[0]
         for n in self.neighbors:
-            if self.model.power.get_power(n.position) > self.model.power.get_power(target.position):
+            if self.model.power_cache.get(n) > self.model.power_cache.get(target):
                 target = n
         return [target]
     
     def crowd(self):
-        crowd = []
-        for n in self.neighbors:
-            distance = self.space.calculate_distances(point=self.position, agents=[n])
-            if distance[0] < self.separation:
-                crowd.append(n)
-        return crowd
+        # distances come with the neighbors from the spatial index
+        return [n for n, distance in zip(self.neighbors, self.neighbor_distances) if distance < self.separation]
     
     def agoraphobic(self, crowd):
         delta = self.space.calculate_difference_vector(self.position, agents=crowd)
@@ -462,7 +425,7 @@ class GP(ContinuousSpaceAgent):
         return self.direction
     
     def get_recharge(self):
-        return np.multiply(self.efficiency, self.model.power.get_power(self.position))
+        return np.multiply(self.efficiency, self.model.power_cache.get(self))
     
     def get_speed(self):
         #self.speed = np.multiply(np.divide(self.battery, 100), self.max_speed)
@@ -500,11 +463,16 @@ class GP(ContinuousSpaceAgent):
         if self.battery < 0:
             self.battery = 0
         return
+
+    def load_calculation(self):
+        self.load = np.multiply(self.efficiency, self.model.power_cache.get(self))
+
+        return self.load
   
     def get_separation(self):
         #print("separation at step ", self.step_number," = ", self.separation)
-        neighbors_power = [self.model.power.get_power(n.position) for n in self.neighbors]
-        self.separation = separation(s_min=self.min_separation, agent_power=self.model.power.get_power(self.position), neighbours_power=neighbors_power)
+        neighbors_power = [self.model.power_cache.get(n) for n in self.neighbors]
+        self.separation = separation(s_min=self.min_separation, agent_power=self.model.power_cache.get(self), neighbours_power=neighbors_power)
         return
 
         
@@ -520,10 +488,13 @@ class GP(ContinuousSpaceAgent):
     
     def energy_hervesting(self):
 
-        self.energy_harvested = self.model.power.get_power(self.position)
+        self.energy_harvested = self.model.power_cache.get(self)
 
         self.total_energy_harvested += self.energy_harvested     
-        neighbor_energies = [a.energy_harvested for a in self.neighbors]
+        if not self.policy.mobile:
+            return
+        arrays = self.model.agent_arrays
+        neighbor_energies = arrays.energy_harvested[self.neighbor_rows]
         self.mean_energy_harvested = np.mean(neighbor_energies)
         #print("mean energy at step ",self.step_number," of neighbors = ", self.mean_energy_harvested)
         
@@ -546,4 +517,28 @@ class GP(ContinuousSpaceAgent):
             self.direction[1] = -self.direction[1]
             position[1] = self.position[1] + self.direction[1] * self.speed
         self.position = position
-        return
\ No newline at end of file
+        return
+
+
+class WEC(SwarmAgent):
+    """WEC heading to the neighbor with the highest power."""
+
+    __slots__ = ()
+
+    policy = TargetPolicy()
+
+
+class GP(SwarmAgent):
+    """WEC heading to the maximum of a GP surrogate of the neighbors' power."""
+
+    __slots__ = ()
+
+    policy = GPPolicy()
+
+
+class STATIC(SwarmAgent):
+    """Moored WEC, it never moves."""
+
+    __slots__ = ()
+
+    policy = StaticPolicy()
@@ -1,140 +1,265 @@
 import os
 import sys
+import threading
+import time
+
+import numpy as np
 import solara
 import solara.lab                           # NEW ─ tabs live here
 sys.path.insert(0, os.path.abspath("../../../.."))
 
 from model import WECswarm, WECgp, WECSTATIC
-from mesa.visualization import Slider, SolaraViz, make_space_component, draw_space, make_plot_component
-from mesa.visualization.utils import update_counter
+from collector import MODEL_METRICS
+from viewport import OceanPyramid, TileStream, colormap_table, css_colors, encode_agents
+from mesa.visualization import Slider
 from matplotlib import pyplot as plt
+from matplotlib.colors import to_rgba_array
 
 
-# Pre-compute markers for different angles (e.g., every 10 degrees)
-def make_space_component(
-    agent_portrayal: None = None,
-    propertylayer_portrayal: dict | None = None,
-    post_process: None = None,
-    backend: str = "matplotlib",
-    **space_drawing_kwargs,
-):
-    
-    if backend == "matplotlib":
-        return make_mpl_space_component(
-            agent_portrayal,
-            propertylayer_portrayal,
-            post_process,
-            **space_drawing_kwargs,
-        )
+class Snapshot:
+    """Copy of what the UI shows of a model at one step.
+
+    Taken by ``take_snapshot`` while the model is not stepping, it can then be
+    drawn at any time, also while the model goes on in another thread.
+    """
+
+    def __init__(self, step, version, pyramid, positions, codes, palette, metrics):
+        self.step = step
+        self.version = version      # Ocean.version of the pyramid
+        self.pyramid = pyramid      # viewport.OceanPyramid of the ocean field
+        self.positions = positions
+        self.codes = codes          # status of every agent, index in palette
+        self.palette = palette      # RGBA color of every status
+        self.metrics = metrics      # {"Step": steps, metric: values}, the model metrics so far
+
+
+def take_snapshot(model, previous=None, max_agents=None, tile=128, copy=False):
+    """Snapshot of ``model`` for the UI.
+
+    Args:
+        model: The model, not stepping while the snapshot is taken
+        previous: The previous snapshot, its ocean pyramid is reused if the ocean did not change
+        max_agents: Show at most this many agents, evenly picked (default: None, all)
+        tile: Side of the tiles of the ocean pyramid (default: 128)
+        copy: Copy the arrays that the model keeps updating in place, needed when the
+            model steps in another thread (default: False)
+    """
+    ocean = model.power
+    ocean.refresh()   # a lazy ocean is brought up to date before drawing
+    if previous is not None and previous.version == ocean.version:
+        pyramid = previous.pyramid
     else:
-        raise ValueError(
-            f"unknown backend {backend}, must be one of matplotlib, altair"
-        )
+        # a tiled ocean gives a coarse overview, stretched over the whole space
+        cell = ocean.width / ocean.data.shape[0]
+        pyramid = OceanPyramid(ocean.data, max_power=ocean.max_power, tile=tile, cell=cell)
+
+    positions = model.space.agent_positions
+    codes = wec_status(*wec_state(model))
+    if max_agents and len(positions) > max_agents:
+        stride = -(-len(positions) // max_agents)
+        positions, codes = positions[::stride], codes[::stride]
 
-def make_mpl_space_component(
-    agent_portrayal: None = None,
-    propertylayer_portrayal: dict | None = None,
-    post_process: None = None,
-    **space_drawing_kwargs,
-):
-    """Create a Matplotlib-based space visualization component.
+    metrics = None
+    if copy:
+        metrics = {"Step": model.datacollector.collected_steps().copy()}
+        metrics.update({name: values.copy() for name, values in model.datacollector.model_columns().items()})
+    return Snapshot(model.steps, ocean.version, pyramid, np.array(positions), codes, WEC_PALETTE, metrics)
+
+
+class SpaceFigure:
+    """Matplotlib figure of the ocean and the agents, built once and updated in place.
+
+    The ocean image and the agents' scatter are created with the figure; a
+    frame only replaces the image data (when the ocean changed), the scatter
+    offsets and colors, taken as arrays from the snapshot. The ocean is the
+    level of the snapshot pyramid with about one cell per pixel, stretched
+    over the space. Updates that come faster than ``max_fps`` are skipped,
+    the figure then stays at the last frame.
 
     Args:
-        agent_portrayal: Function to portray agents.
-        propertylayer_portrayal: Dictionary of PropertyLayer portrayal specifications
-        post_process : a callable that will be called with the Axes instance. Allows for fine tuning plots (e.g., control ticks)
-        space_drawing_kwargs : additional keyword arguments to be passed on to the underlying space drawer function. See
-                               the functions for drawing the various spaces for further details.
+        space: The space of the model, for the limits of the axes
+        snapshot: The first snapshot to draw
+        pixels: Width of the figure in pixels (default: 600)
+        max_fps: Redraw at most this many times per second (default: None, every update)
+    """
+
+    def __init__(self, space, snapshot, pixels=600, max_fps=None):
+        self.min_interval = 1 / max_fps if max_fps else 0.0
+        self.fig = plt.Figure(figsize=(6, 6), dpi=pixels / 6)
+        ax = self.fig.add_subplot()
+
+        # same layout as mesa's draw_continuous_space
+        width = space.x_max - space.x_min
+        height = space.y_max - space.y_min
+        self.bounds = [space.x_min - width / 20, space.x_max + width / 20, space.y_min - height / 20, space.y_max + height / 20]
+        self.pixels = pixels
+        self.image = ax.imshow(np.zeros((1, 1), dtype=np.uint8), cmap="inferno", vmin=0, vmax=255)
+        self.scatter = ax.scatter(np.empty(0), np.empty(0), s=20)
+        border_style = "solid" if not space.torus else (0, (5, 10))
+        for spine in ax.spines.values():
+            spine.set_linewidth(1.5)
+            spine.set_color("black")
+            spine.set_linestyle(border_style)
+        ax.set_xlim(*self.bounds[:2])
+        ax.set_ylim(*self.bounds[2:])
+        self.fig.tight_layout()   # once, instead of bbox_inches="tight" at every frame
 
-    ``agent_portrayal`` is called with an agent and should return a dict. Valid fields in this dict are "color",
-    "size", "marker", "zorder", alpha, linewidths, and edgecolors. Other field are ignored and will result in a user warning.
+        self.pyramid = None
+        self.snapshot = None
+        self.drawn_at = None
+        self.frame = 0
+        self.show(snapshot)
 
-    Returns:
-        function: A function that creates a SpaceMatplotlib component
+    def show(self, snapshot, force=True):
+        """Draw ``snapshot``, unless the last frame is more recent than ``max_fps`` allows."""
+        now = time.monotonic()
+        if not force and self.drawn_at is not None and now - self.drawn_at < self.min_interval:
+            return
+        if snapshot.pyramid is not self.pyramid:
+            pyramid = self.pyramid = snapshot.pyramid
+            level = pyramid.level_for(self.bounds, self.pixels)
+            data = pyramid.levels[level]
+            scale = 2 ** level * pyramid.cell
+            self.image.set_data(data)
+            # row r of the level covers [r * scale - 0.5, (r + 1) * scale - 0.5] along y
+            self.image.set_extent((-0.5, data.shape[1] * scale - 0.5, data.shape[0] * scale - 0.5, -0.5))
+        self.scatter.set_offsets(snapshot.positions)
+        self.scatter.set_facecolor(snapshot.palette[snapshot.codes])
+        self.snapshot = snapshot
+        self.drawn_at = now
+        self.frame += 1
+
+
+class MetricsFigure:
+    """Line plots of the model metrics of the snapshots, updated in place.
+
+    Plotting the metrics costs more than the space, they are redrawn at most
+    once every ``min_interval`` seconds.
     """
-    if agent_portrayal is None:
-
-        def agent_portrayal(a):
-            return {}
-
-    def MakeSpaceMatplotlib(model):
-        return SpaceMatplotlib(
-            model,
-            agent_portrayal,
-            propertylayer_portrayal,
-            post_process=post_process,
-            **space_drawing_kwargs,
-        )
 
-    return MakeSpaceMatplotlib
+    def __init__(self, names, min_interval=1.0):
+        self.min_interval = min_interval
+        self.snapshot = None
+        self.drawn_at = None
+        self.frame = 0
+        self.fig = plt.Figure(figsize=(9, 2.5 * ((len(names) + 2) // 3)))
+        axes = self.fig.subplots((len(names) + 2) // 3, 3, squeeze=False).ravel()
+        self.lines = {}
+        for ax, name in zip(axes, names):
+            ax.set_title(name, fontsize=9)
+            self.lines[name] = ax.plot([], [])[0]
+        for ax in axes[len(names):]:
+            ax.set_visible(False)
+        self.fig.tight_layout()
 
-@solara.component
-def SpaceMatplotlib(
-    model,
-    agent_portrayal,
-    propertylayer_portrayal,
-    dependencies: list[any] | None = None,
-    post_process: None = None,
-    **space_drawing_kwargs,
-):
-    """Create a Matplotlib-based space visualization component."""
-    update_counter.get()
-
-    space = getattr(model, "grid", None)
-    if space is None:
-        space = getattr(model, "space", None)
-
-    fig = plt.Figure()
-    ax = fig.add_subplot()
-
-    ax.imshow(
-        X=model.power.data,
-        cmap='inferno',
-        alpha=1,
-    )
-    
-    draw_space(
-        space,
-        agent_portrayal,
-        propertylayer_portrayal=propertylayer_portrayal,
-        ax=ax,
-        **space_drawing_kwargs,
-    )
+    def show(self, snapshot, force=False):
+        self.snapshot = snapshot
+        now = time.monotonic()
+        if not force and self.drawn_at is not None and now - self.drawn_at < self.min_interval:
+            return
+        self.drawn_at = now
+        self.frame += 1
+        steps = snapshot.metrics["Step"]
+        for name, line in self.lines.items():
+            line.set_data(steps, snapshot.metrics[name])
+            line.axes.relim()
+            line.axes.autoscale_view()
 
-    if post_process is not None:
-        post_process(ax)
 
-    solara.FigureMatplotlib(
-        fig, format="png", bbox_inches="tight", dependencies=dependencies
-    )
+class SimulationThread(threading.Thread):
+    """Steps a model in a background thread, decoupled from the UI.
+
+    The model runs at full speed, or at most ``steps_per_second`` steps per
+    second, and publishes a ``snapshot`` at most ``snapshots_per_second`` times
+    per second (the display rate); the UI only reads ``snapshot`` and never
+    touches the model while it steps.
+
+    Args:
+        model: The model to step
+        max_agents: Agents in a snapshot, evenly picked (default: 2000)
+        tile: Side of the tiles of the ocean pyramid in a snapshot (default: 128)
+    """
+
+    def __init__(self, model, max_agents=2000, tile=128):
+        super().__init__(daemon=True)
+        self.model = model
+        self.max_agents = max_agents
+        self.tile = tile
+        self.steps_per_second = 0       # 0: full speed
+        self.snapshots_per_second = 5
+        self.lock = threading.Lock()    # held while the model steps or is read
+        self.playing = threading.Event()
+        self.stopped = threading.Event()
+        self.snapshot = None
+        self.publish()
+
+    def publish(self):
+        with self.lock:
+            if self.stopped.is_set():   # the model is closed
+                return
+            self.snapshot = take_snapshot(
+                self.model, previous=self.snapshot,
+                max_agents=self.max_agents, tile=self.tile, copy=True,
+            )
+        self.published_at = time.monotonic()
+
+    def step(self):
+        with self.lock:
+            if self.stopped.is_set():
+                return
+            self.model.step()
+        if not self.model.running:
+            self.playing.clear()
+        if not self.playing.is_set() or time.monotonic() - self.published_at >= 1 / self.snapshots_per_second:
+            self.publish()
+
+    def run(self):
+        while not self.stopped.is_set():
+            if not self.playing.wait(timeout=0.1):
+                continue
+            started = time.monotonic()
+            self.step()
+            if self.steps_per_second:
+                time.sleep(max(0.0, 1 / self.steps_per_second - (time.monotonic() - started)))
 
+    def stop(self):
+        """Stop stepping and close the model: the page made a new one (Reset) or went away."""
+        self.stopped.set()
+        self.playing.clear()
+        with self.lock:
+            self.model.close()
 
 
-def wec_draw(agent):
-    neighbors = len(agent.neighbors)
-
-    # Calculate the angle
-    deg = agent.angle
-    # Round to nearest 10 degrees
-    rounded_deg = round(deg / 10) * 10 % 360
-
-    # using cached markers to speed things up
-    if neighbors <= 1:
-        return {"color": "red", "size": 20}
-    if neighbors > 1:
-        if agent.battery > 20:
-            if agent.battery > 90:
-                return {"color": "blue", "size": 20}
-            if agent.WEC_power >= 0:
-                return {"color": "green", "size": 20}
-            else:
-                return {"color": "yellow", "size": 20}
-        elif agent.battery < 20:
-            if agent.battery < 10:
-                return {"color": "black", "size": 20}
-            return {"color": "grey", "size": 20}
-        
-    
+# status of a WEC, index in WEC_PALETTE
+WEC_ISOLATED, WEC_FULL, WEC_CHARGING, WEC_DISCHARGING, WEC_LOW, WEC_EMPTY, WEC_UNCLASSIFIED = range(7)
+WEC_PALETTE = to_rgba_array(["red", "blue", "green", "yellow", "grey", "black", "tab:blue"])
+
+
+def wec_state(model):
+    """Neighbor count, battery and WEC power of the agents, in the order of the space rows."""
+    arrays = getattr(model, "agent_arrays", None)
+    if arrays is not None:
+        return arrays.n_neighbors, arrays.battery, arrays.WEC_power
+    rows = np.array(
+        [(len(a.neighbors), a.battery, a.WEC_power) for a in model.space.active_agents], dtype=float
+    ).reshape(-1, 3)
+    return rows.T
+
+
+def wec_status(n_neighbors, battery, wec_power):
+    """Status of every WEC from its neighbor count, battery and power, in one pass.
+
+    A WEC with at most one neighbor is isolated, otherwise its battery and
+    power decide; a battery of exactly 20 is left unclassified.
+    """
+    n_neighbors, battery, wec_power = np.asarray(n_neighbors), np.asarray(battery), np.asarray(wec_power)
+    charged = battery > 20
+    return np.select(
+        [n_neighbors <= 1, battery > 90, charged & (wec_power >= 0), charged, battery < 10, battery < 20],
+        [WEC_ISOLATED, WEC_FULL, WEC_CHARGING, WEC_DISCHARGING, WEC_EMPTY, WEC_LOW],
+        default=WEC_UNCLASSIFIED,
+    ).astype(np.uint8)
+
 
 model_params = {
     "seed": Slider(
@@ -210,57 +335,178 @@ model_params = {
         max=100,
         step=1,
     ),
+    "ocean_update_every": Slider(
+        label="Ocean update every (steps)",
+        value=1,
+        min=1,
+        max=50,
+        step=1,
+    ),
 }
 
 
-# component lists
-comps = [
-    make_space_component(agent_portrayal=wec_draw, backend="matplotlib"),
-   # make_plot_component(measure="count_agent_in_zone"),
-    make_plot_component(measure="mean_energy_harvested"),
-    make_plot_component(measure="net_energy_harvested"),
-    make_plot_component(measure="total_energy_harvested"),
-    make_plot_component(measure="avg_battery"),
-    make_plot_component(measure="connections"),
-    make_plot_component(measure="total_load"),
-]
+@solara.component_vue("ocean_view.vue")
+def OceanCanvas(tiles, level, tile, cell, agents, palette, colormap, bounds, view, on_view, pixels, radius, event_reset):
+    pass
+
+
+@solara.component
+def SpaceMatplotlib(simulation, snapshot, playing, max_fps=10):
+    """Ocean and agents of ``snapshot`` as a PNG of a ``SpaceFigure`` kept across updates.
+
+    The PNG is only encoded again when a new frame was drawn; while paused
+    every snapshot is drawn.
+    """
+    figure = solara.use_memo(
+        lambda: SpaceFigure(simulation.model.space, snapshot, max_fps=max_fps), dependencies=[simulation]
+    )
+    if figure.snapshot is not snapshot:
+        figure.show(snapshot, force=not playing)
+    solara.FigureMatplotlib(figure.fig, format="png", dependencies=[figure, figure.frame])
+
+
+@solara.component
+def OceanView(simulation, snapshot, pixels=600):
+    """Ocean and agents of ``snapshot`` drawn by the browser (``ocean_view.vue``).
+
+    Only the pyramid tiles in view that the browser does not have yet are
+    sent, the agents as one binary array. Wheel zooms, drag pans and a double
+    click shows the whole space again.
+    """
+    space = simulation.model.space
+    width = space.x_max - space.x_min
+    height = space.y_max - space.y_min
+    bounds = [space.x_min - width / 20, space.x_max + width / 20, space.y_min - height / 20, space.y_max + height / 20]
+    viewed, set_viewed = solara.use_state((None, None))   # (simulation, view)
+    view = viewed[1] if viewed[0] is simulation else bounds
+    stream = solara.use_memo(TileStream, dependencies=[simulation])
+    colormap = solara.use_memo(colormap_table, dependencies=[])
+    _, set_resets = solara.use_state(0)
+
+    def reset(*_):
+        # the browser lost its tiles: send again all the ones in view
+        stream.reset()
+        set_resets(lambda resets: resets + 1)
+
+    level, tiles = stream.update(snapshot.pyramid, view, pixels)
+    OceanCanvas(
+        tiles=tiles,
+        level=level,
+        tile=snapshot.pyramid.tile,
+        cell=snapshot.pyramid.cell,
+        agents=encode_agents(snapshot.positions, snapshot.codes),
+        palette=css_colors(snapshot.palette),
+        colormap=colormap,
+        bounds=bounds,
+        view=view,
+        on_view=lambda value: set_viewed((simulation, list(value))),
+        pixels=pixels,
+        radius=3,
+        event_reset=reset,
+    )
+
+
+def initial_params():
+    return {
+        name: param.value if isinstance(param, Slider) else param["value"]
+        for name, param in model_params.items()
+    }
+
+
+@solara.component
+def ParamInput(param, value, on_value):
+    if isinstance(param, Slider):
+        Input = solara.SliderFloat if param.is_float_slider else solara.SliderInt
+        Input(param.label, value=value, min=param.min, max=param.max, step=param.step, on_value=on_value)
+    else:
+        solara.InputInt(param["label"], value=value, on_value=on_value)
+
+
+@solara.component
+def LivePage(model_class, name):
+    """Page of a model stepped by a ``SimulationThread``.
+
+    The page follows the snapshots of the thread at the display rate, the
+    model steps at its own rate; the parameters apply at the next Reset.
+    """
+    params, set_params = solara.use_state(initial_params())
+    generation, set_generation = solara.use_state(0)   # a new model at every Reset
+    simulation = solara.use_memo(
+        lambda: SimulationThread(model_class(**params)), dependencies=[model_class, generation]
+    )
+
+    def start():
+        simulation.start()
+        return simulation.stop
+
+    solara.use_effect(start, [simulation])
+
+    followed, set_followed = solara.use_state((None, None))   # (simulation, snapshot) on display
+
+    def follow(cancel):
+        # setting the state renders in this thread: it must not be interrupted, hence no intrusive cancel
+        while not cancel.is_set():
+            set_followed((simulation, simulation.snapshot))
+            cancel.wait(1 / simulation.snapshots_per_second)
+
+    solara.use_thread(follow, dependencies=[simulation], intrusive_cancel=False)
+    snapshot = followed[1] if followed[0] is simulation else simulation.snapshot
+
+    metrics_figure = solara.use_memo(lambda: MetricsFigure(MODEL_METRICS), dependencies=[simulation])
+    matplotlib, set_matplotlib = solara.use_state(False)   # draw the space with SpaceMatplotlib
+
+    def toggle():
+        if simulation.playing.is_set():
+            simulation.playing.clear()
+        else:
+            simulation.playing.set()
+
+    def set_steps_per_second(value):
+        simulation.steps_per_second = value
+
+    def set_snapshots_per_second(value):
+        simulation.snapshots_per_second = value
+
+    playing = simulation.playing.is_set()
+    with solara.Sidebar():
+        with solara.Row():
+            solara.Button("Pause" if playing else "Play", on_click=toggle)
+            solara.Button("Step", on_click=simulation.step, disabled=playing)
+            solara.Button("Reset", on_click=lambda: set_generation(generation + 1))
+        solara.SliderInt(
+            "Steps per second (0: full speed)", value=simulation.steps_per_second, min=0, max=100,
+            on_value=set_steps_per_second,
+        )
+        solara.SliderInt(
+            "Frames per second", value=simulation.snapshots_per_second, min=1, max=30,
+            on_value=set_snapshots_per_second,
+        )
+        solara.Checkbox(label="Draw the space with matplotlib", value=matplotlib, on_value=set_matplotlib)
+        for key, param in model_params.items():
+            ParamInput(param, params[key], lambda value, key=key: set_params({**params, key: value}))
+
+    solara.Markdown(f"## {name}\nStep: {snapshot.step}")
+    if metrics_figure.snapshot is not snapshot:
+        metrics_figure.show(snapshot, force=not playing)   # paused: the last step is shown in full
+    if matplotlib:
+        SpaceMatplotlib(simulation, snapshot, playing)
+    else:
+        OceanView(simulation, snapshot)
+    solara.FigureMatplotlib(metrics_figure.fig, format="png", dependencies=[metrics_figure, metrics_figure.frame])
+
 
 # ─── two little wrapper components ────────────────────────────────────────
 @solara.component
 def DynamicPage():
-    #model = solara.reactive(WECswarm())         #if we want to simulation doesn't intrupt when we switch to the other page
-    color=0;
-    model = WECswarm()
-    return SolaraViz(
-        model,
-        components = comps,
-        model_params=model_params,
-        name="Dynamic WECs",
-    )
+    return LivePage(WECswarm, "Dynamic WECs")
 
 @solara.component
 def GPPage():
-    #model = solara.reactive(WECswarm())         #if we want to simulation doesn't intrupt when we switch to the other page
-    color=0;
-    model = WECgp()
-    return SolaraViz(
-        model,
-        components = comps,
-        model_params = model_params,
-        name="Gaussian Process WECs",
-    )
+    return LivePage(WECgp, "Gaussian Process WECs")
 
 @solara.component
 def StaticPage():
-    #model = solara.reactive(WECSTATIC())                 #if we want to simulation doesn't intrupt when we switch to the other page
-    
-    model = WECSTATIC()
-    return SolaraViz(
-        model,
-        components = comps,
-        model_params = model_params,
-        name="Static WECs",
-    )
+    return LivePage(WECSTATIC, "Static WECs")
 
 # ─── tell Solara about our two routes ────────────────────────────────────
 routes = [
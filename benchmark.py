@@ -0,0 +1,165 @@
+"""Benchmark suite.
+
+Times one step of each model for several swarm and ocean sizes, plus the hot
+functions on their own, and writes the results to a JSON file. A previous
+results file can be given as baseline to spot regressions.
+
+Example:
+    python benchmark.py --out bench.json
+    python benchmark.py --populations 100 1000 --oceans 100 --baseline bench.json
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from model import WECswarm, WECgp, WECSTATIC
+from environment import Ocean
+from separation import separation
+from direction import get_direction
+
+MODELS = {
+    "WECswarm": WECswarm,
+    "WECgp": WECgp,
+    "WECSTATIC": WECSTATIC,
+}
+
+
+def measure(function, repeats, number=1):
+    """Run ``function`` ``number`` times per repeat; return the seconds per call of each repeat."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+    return timings
+
+
+def record(name, params, timings):
+    return {
+        "name": name,
+        "params": params,
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "repeats": len(timings),
+    }
+
+
+def bench_models(models, populations, oceans, repeats, vectorized):
+    results = []
+    for model_name in models:
+        for population_size in populations:
+            for size in oceans:
+                params = {"population_size": population_size, "width": size, "height": size}
+                if vectorized:
+                    params["vectorized"] = True
+                model = MODELS[model_name](**params)
+                model.step()  # warm up: first ocean update, caches, imports
+                results.append(record(f"{model_name}.step", params, measure(model.step, repeats)))
+                print(f"{model_name}.step {params}: {results[-1]['median']:.4f} s")
+    return results
+
+
+def bench_functions(oceans, repeats):
+    results = []
+    rng = np.random.default_rng(0)
+
+    for size in oceans:
+        ocean = Ocean(width=size, height=size, seed=0)
+        ocean.modify_ocean()
+        ocean.update()
+        results.append(record("Ocean.update", {"size": size}, measure(ocean.update, repeats)))
+
+        points = rng.random((1000, 2)) * (size - 1)
+        def interpolate():
+            for point in points:
+                ocean.bilinear_interpolation(point)
+        timings = [t / len(points) for t in measure(interpolate, repeats)]
+        results.append(record("Ocean.bilinear_interpolation", {"size": size}, timings))
+
+    powers = rng.random(20)
+    results.append(record(
+        "separation.separation", {"neighbors": 20},
+        measure(lambda: separation(s_min=5, agent_power=0.5, neighbours_power=powers), repeats, number=100),
+    ))
+
+    agent = SimpleNamespace(position=np.array([50.0, 50.0]), vision=20, unique_id=0)
+    neighbours = [
+        SimpleNamespace(position=p, power=v, unique_id=k + 1)
+        for k, (p, v) in enumerate(zip(50 + rng.uniform(-20, 20, (20, 2)), rng.random(20)))
+    ]
+    results.append(record(
+        "direction.get_direction", {"neighbors": 20},
+        measure(lambda: get_direction(agent, neighbours), repeats, number=20),
+    ))
+    for result in results:
+        print(f"{result['name']} {result['params']}: {result['median'] * 1e3:.4f} ms")
+    return results
+
+
+def key(result):
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+
+def compare(results, baseline, threshold):
+    """Print the ratio to the baseline of every benchmark; return the regressions."""
+    previous = {key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        ratio = result["median"] / old["median"]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(result)
+            flag = "  <-- slower"
+        print(f"{result['name']} {result['params']}: {ratio:.2f}x baseline{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Step throughput benchmarks of the WEC models.")
+    parser.add_argument("--models", nargs="+", default=sorted(MODELS), choices=sorted(MODELS))
+    parser.add_argument("--populations", nargs="+", type=int, default=[100, 1000, 10000])
+    parser.add_argument("--oceans", nargs="+", type=int, default=[100, 500, 1000], help="side of the square ocean")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--vectorized", action="store_true", help="step the models with the SwarmEngine")
+    parser.add_argument("--skip-models", action="store_true", help="only run the function benchmarks")
+    parser.add_argument("--out", default="bench.json", help="JSON file for the results")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slow down reported as regression")
+    args = parser.parse_args(argv)
+
+    results = bench_functions(args.oceans, args.repeats)
+    if not args.skip_models:
+        results += bench_models(args.models, args.populations, args.oceans, args.repeats, args.vectorized)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as out:
+        json.dump(report, out, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.threshold)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} benchmarks slower than the baseline")
+
+
+if __name__ == "__main__":
+    main()
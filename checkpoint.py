@@ -0,0 +1,267 @@
+"""Checkpoint and restore of a running model.
+
+A checkpoint is a directory:
+
+- ``meta.json``: format version, model class, constructor arguments, scalar
+  state and the state of every random generator
+- ``state.npz``: agent arrays, neighbor lists, GP factorizations and the
+  metrics collected so far
+- ``ocean.npy`` (and ``keyframe0.npy``, ``keyframe1.npy`` with an
+  interpolated ocean): the power fields, one ``.npy`` each
+
+The ocean fields are streamed to disk straight from ``Ocean.data`` and read
+back memory-mapped into the existing buffer, so neither saving nor restoring a
+large ocean holds a second copy of it in memory. Restoring rebuilds the model
+from its constructor arguments and overwrites its state, the run then
+continues exactly as it would have without the checkpoint.
+
+Example:
+    save_checkpoint(model, "run.ckpt")
+    model = load_checkpoint("run.ckpt")
+"""
+
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+import model as models
+from agents import AGENT_FIELDS
+from direction import GPState
+from engine import SwarmEngine
+from environment import Ocean
+
+FORMAT = "wec-checkpoint"
+VERSION = 1
+
+# per-agent columns of ``model.agent_arrays``; the neighbor counts are saved with the neighbor lists
+_AGENT_FIELDS = tuple(name for name in AGENT_FIELDS if name != "n_neighbors")
+
+
+def _generator_state(generator):
+    return generator.bit_generator.state
+
+
+def _set_generator_state(generator, state):
+    generator.bit_generator.state = state
+
+
+def _agent_arrays(model):
+    space = model.space
+    state = model.agent_arrays
+    arrays = {f"agent_{name}": getattr(state, name) for name in _AGENT_FIELDS}
+    arrays["agent_ids"] = np.array([a.unique_id for a in space.active_agents], dtype=np.int64)
+    arrays["agent_position"] = np.array(space.agent_positions, dtype=float)
+    arrays["agent_direction"] = model.directions
+
+    # neighbor lists as rows of the space, concatenated
+    counts, rows, distances = state.neighbor_table()
+    arrays["neighbor_counts"] = counts
+    arrays["neighbor_rows"] = rows.astype(np.int64)
+    arrays["neighbor_distances"] = distances
+    return arrays
+
+
+def _restore_agents(model, arrays):
+    space = model.space
+    if not np.array_equal(arrays["agent_ids"], [a.unique_id for a in space.active_agents]):
+        raise ValueError("the agents of the checkpoint do not match the ones of the rebuilt model")
+
+    space.agent_positions[:] = arrays["agent_position"]
+    model.directions[:] = arrays["agent_direction"]
+    state = model.agent_arrays
+    for name in _AGENT_FIELDS:
+        getattr(state, name)[:] = arrays[f"agent_{name}"]
+    state.set_neighbors(
+        arrays["neighbor_counts"], arrays["neighbor_rows"].astype(np.intp), arrays["neighbor_distances"]
+    )
+
+
+def _gp_arrays(cache):
+    states = list(cache.states.items())  # least recently used first
+    return {
+        "gp_keys": np.array([key for key, _ in states], dtype=np.int64),
+        "gp_sizes": np.array([len(state.ids) for _, state in states], dtype=np.int64),
+        "gp_ids": np.concatenate([np.asarray(s.ids, dtype=np.int64) for _, s in states] + [np.empty(0, np.int64)]),
+        "gp_X": np.concatenate([s.X for _, s in states] + [np.empty((0, 2))]),
+        "gp_L": np.concatenate([s.L.reshape(-1) for _, s in states] + [np.empty(0)]),
+    }
+
+
+def _restore_gp(cache, arrays):
+    cache.states.clear()
+    sizes = arrays["gp_sizes"]
+    ids = np.split(arrays["gp_ids"], np.cumsum(sizes)[:-1])
+    X = np.split(arrays["gp_X"], np.cumsum(sizes)[:-1])
+    L = np.split(arrays["gp_L"], np.cumsum(sizes ** 2)[:-1])
+    for key, k, state_ids, state_X, state_L in zip(arrays["gp_keys"].tolist(), sizes, ids, X, L):
+        state = GPState()
+        state.ids, state.X, state.L = state_ids, state_X, state_L.reshape(k, k)
+        cache.states[key] = state
+
+
+def _collector_arrays(collector):
+    stored = min(collector.count, collector.capacity)
+    arrays = {
+        "collector_steps": collector.steps[:stored],
+        "collector_model_vars": collector.model_vars[:, :stored],
+    }
+    if collector.agent_vars is not None:
+        arrays["collector_agent_ids"] = collector.agent_ids
+        arrays["collector_agent_vars"] = collector.agent_vars[:, :stored]
+    return arrays
+
+
+def _restore_collector(collector, meta, arrays):
+    collector.window = meta["window"]
+    collector.capacity = meta["capacity"]
+    collector.count = meta["count"]
+    # the collections before the checkpoint are already in the sink of the checkpointed run
+    collector.flushed = collector.count
+    stored = min(collector.count, collector.capacity)
+
+    collector.steps = np.empty(collector.capacity, dtype=np.int64)
+    collector.steps[:stored] = arrays["collector_steps"]
+    collector.model_vars = np.empty((len(arrays["collector_model_vars"]), collector.capacity))
+    collector.model_vars[:, :stored] = arrays["collector_model_vars"]
+    if "collector_agent_vars" in arrays:
+        agent_vars = arrays["collector_agent_vars"]
+        collector.agent_ids = arrays["collector_agent_ids"]
+        collector.agent_vars = np.empty(
+            (agent_vars.shape[0], collector.capacity, agent_vars.shape[2]), dtype=collector.dtype
+        )
+        collector.agent_vars[:, :stored] = agent_vars
+
+
+def save_checkpoint(model, path):
+    """Write the full state of ``model`` to the directory ``path``.
+
+    The checkpoint is written next to ``path`` and moved in place at the end,
+    a crash while saving leaves the previous checkpoint intact. Metrics still
+    buffered for a sink are flushed to it first.
+
+    Args:
+        model: A ``SwarmModel`` (WECswarm, WECgp, WECSTATIC)
+        path: Checkpoint directory, replaced if it exists
+    """
+    ocean = model.power
+    if not isinstance(ocean, Ocean):
+        raise ValueError("checkpoints support the whole-grid Ocean only")
+    if model.shared_ocean:
+        raise ValueError("a model sharing its ocean with other models cannot be checkpointed alone")
+    collector = model.datacollector
+    collector.flush()
+
+    tmp = path.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    fields = {"ocean": ocean.data}
+    if ocean.keyframes is not None:
+        fields.update({f"keyframe{k}": field for k, field in enumerate(ocean.keyframes)})
+    for name, field in fields.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), field)  # written from the array itself, no copy
+
+    arrays = _agent_arrays(model)
+    arrays.update(_gp_arrays(model.gp_cache))
+    arrays.update(_collector_arrays(collector))
+    arrays["agent_angles"] = model.agent_angles
+    np.savez(os.path.join(tmp, "state.npz"), **arrays)
+
+    version, internal, gauss_next = model.random.getstate()
+    meta = {
+        "format": FORMAT,
+        "version": VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": type(model).__name__,
+        "params": {name: value for name, value in model.params.items() if name != "collect_sink"},
+        "steps": model.steps,
+        "running": model.running,
+        "cumulative_load": model.cumulative_load,
+        "count": model.count,
+        "average_heading": float(model.average_heading),
+        "random": {"version": version, "internal": list(internal), "gauss_next": gauss_next},
+        "rng": _generator_state(model.rng),
+        "ocean": {
+            "fields": sorted(fields),
+            "dtype": str(ocean.data.dtype),
+            "shape": list(ocean.data.shape),
+            "rng": _generator_state(ocean.rng),
+            "sigma": ocean.sigma,
+            "index": ocean.index,
+            "time": ocean.time,
+            "evolutions": ocean.evolutions,
+            "dirty": ocean.dirty,
+            "version": ocean.version,
+        },
+        "collector": {"window": collector.window, "capacity": collector.capacity, "count": collector.count},
+    }
+    with open(os.path.join(tmp, "meta.json"), "w") as file:
+        json.dump(meta, file, indent=1)
+
+    old = path.rstrip(os.sep) + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def read_meta(path):
+    """Metadata of the checkpoint in ``path``; raises ValueError if the format is not supported."""
+    with open(os.path.join(path, "meta.json")) as file:
+        meta = json.load(file)
+    if meta.get("format") != FORMAT:
+        raise ValueError(f"{path} is not a model checkpoint")
+    if meta["version"] > VERSION:
+        raise ValueError(f"checkpoint version {meta['version']} is newer than the supported {VERSION}")
+    return meta
+
+
+def load_checkpoint(path, **overrides):
+    """Rebuild the model saved in ``path``, ready to continue from the saved step.
+
+    Args:
+        path: Checkpoint directory written by ``save_checkpoint``
+        **overrides: Constructor arguments that do not change the dynamics, e.g.
+            a new ``collect_sink`` for the collections after the checkpoint
+    """
+    meta = read_meta(path)
+    model = getattr(models, meta["model"])(**{**meta["params"], **overrides})
+
+    # random generators
+    state = meta["random"]
+    model.random.setstate((state["version"], tuple(state["internal"]), state["gauss_next"]))
+    _set_generator_state(model.rng, meta["rng"])
+    model.steps = meta["steps"]
+    model.running = meta["running"]
+    model.cumulative_load = meta["cumulative_load"]
+    model.count = meta["count"]
+    model.average_heading = meta["average_heading"]
+
+    # ocean, read memory-mapped straight into the existing field
+    ocean = model.power
+    info = meta["ocean"]
+    np.copyto(ocean.data, np.load(os.path.join(path, "ocean.npy"), mmap_mode="r"))
+    ocean.keyframes = None
+    if "keyframe0" in info["fields"]:
+        ocean.keyframes = [ocean.buffer(f"keyframe{k}") for k in range(2)]
+        for k, keyframe in enumerate(ocean.keyframes):
+            np.copyto(keyframe, np.load(os.path.join(path, f"keyframe{k}.npy"), mmap_mode="r"))
+    _set_generator_state(ocean.rng, info["rng"])
+    for name in ("sigma", "index", "time", "evolutions", "dirty", "version"):
+        setattr(ocean, name, info[name])
+    model.power_cache.version = None
+
+    with np.load(os.path.join(path, "state.npz")) as archive:
+        arrays = dict(archive)
+    _restore_agents(model, arrays)
+    _restore_gp(model.gp_cache, arrays)
+    _restore_collector(model.datacollector, meta["collector"], arrays)
+    if len(arrays["agent_angles"]):
+        model.agent_angles[:] = arrays["agent_angles"]
+    if model.engine is not None:
+        model.engine = SwarmEngine(model)
+    return model
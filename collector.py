@@ -0,0 +1,203 @@
+"""Columnar data collector for the WEC models.
+
+Drop-in replacement of Mesa's ``DataCollector`` for the metrics of the
+swarm. The agent state is taken directly from the arrays the model keeps it
+in (``model.agent_arrays``) and stored column by column in
+preallocated numpy buffers, so a metric over the whole run is a contiguous
+array that can be handed to pandas or Arrow without copying.
+"""
+
+import numpy as np
+import pandas as pd
+
+MODEL_METRICS = (
+    "mean_energy_harvested",
+    "net_energy_harvested",
+    "total_energy_harvested",
+    "avg_battery",
+    "connections",
+    "total_load",
+)
+
+AGENT_METRICS = (
+    "mean_energy_harvested",
+    "net_energy_harvested",
+    "total_energy_harvested",
+    "battery",
+    "WEC_power",
+)
+
+# agent state read at each collection
+_STATE = ("energy_harvested", "consume", "total_energy_harvested", "battery", "neighbors", "load", "WEC_power")
+
+
+def gather(model):
+    """Agent state of ``model``: the agents and one array per field, in the order of the space rows.
+
+    The arrays are the model's own (``model.agent_arrays``), nothing is copied.
+    """
+    arrays = model.agent_arrays
+    state = {name: getattr(arrays, name) for name in _STATE if name != "neighbors"}
+    state["neighbors"] = arrays.n_neighbors
+    return model.space.active_agents, state
+
+
+def summarize(state):
+    """Model and agent metrics from the gathered state."""
+    n = len(state["battery"])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_energy = np.sum(state["energy_harvested"]) / n
+        model_row = (
+            mean_energy,
+            mean_energy - np.sum(state["consume"]) / n,
+            np.sum(state["total_energy_harvested"]),
+            np.sum(state["battery"]) / n,
+            np.sum(state["neighbors"]),
+            np.sum(state["load"]) / n * 100,
+        )
+    agent_columns = (
+        state["energy_harvested"],
+        state["energy_harvested"],
+        state["total_energy_harvested"],
+        state["battery"],
+        state["WEC_power"],
+    )
+    return model_row, agent_columns
+
+
+class SwarmCollector:
+    """Collect the swarm metrics every ``interval`` steps into columnar buffers.
+
+    Args:
+        interval: Collect only when ``model.steps`` is a multiple of it (default: 1)
+        window: Keep only the last ``window`` collections in a ring buffer;
+            None keeps the whole run (default: None)
+        capacity: Initial number of collections the buffers can hold; they
+            double when full (default: 1024)
+        dtype: dtype of the agent metrics, float32 halves their memory (default: float64)
+        sink: A ``sink.ParquetSink`` or ``sink.HDF5Sink``; collections are appended to it
+            every ``flush_every`` collections and memory is bounded to a window of at
+            least ``flush_every`` collections (default: None, keep everything in memory)
+        flush_every: Collections buffered before writing them to the sink (default: 100)
+    """
+
+    def __init__(self, interval=1, window=None, capacity=1024, dtype=np.float64, sink=None, flush_every=100):
+        self.interval = max(1, int(interval))
+        self.sink = sink
+        self.flush_every = flush_every
+        self.flushed = 0        # collections already written to the sink
+        if sink is not None:
+            window = max(window or flush_every, flush_every)
+        self.window = window
+        self.capacity = window if window is not None else capacity
+        self.dtype = dtype
+        self.count = 0          # collections stored (or seen, with a window)
+        self.agent_ids = None
+        self.steps = np.empty(self.capacity, dtype=np.int64)
+        self.model_vars = np.empty((len(MODEL_METRICS), self.capacity))
+        self.agent_vars = None  # (metric, collection, agent)
+
+    def collect(self, model):
+        step = model.steps
+        if step % self.interval:
+            return
+        agents, state = gather(model)
+        if self.agent_ids is None:
+            self.agent_ids = np.array([a.unique_id for a in agents])
+            self.agent_vars = np.empty((len(AGENT_METRICS), self.capacity, len(agents)), dtype=self.dtype)
+        elif len(agents) != len(self.agent_ids):
+            raise ValueError("SwarmCollector expects a constant number of agents")
+        model_row, agent_columns = summarize(state)
+
+        if self.window is None and self.count == self.capacity:
+            self.grow()
+        slot = self.count % self.capacity
+        self.steps[slot] = step
+        self.model_vars[:, slot] = model_row
+        for metric, column in enumerate(agent_columns):
+            self.agent_vars[metric, slot] = column
+        self.count += 1
+
+        if self.sink is not None and self.count - self.flushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write the collections not yet in the sink."""
+        if self.sink is None or self.count == self.flushed:
+            return
+        slots = np.arange(self.flushed, self.count) % self.capacity
+        self.sink.write(
+            self.steps[slots],
+            {name: self.model_vars[k, slots] for k, name in enumerate(MODEL_METRICS)},
+            self.agent_ids,
+            {name: self.agent_vars[k, slots] for k, name in enumerate(AGENT_METRICS)},
+        )
+        self.flushed = self.count
+
+    def close(self):
+        """Flush and close the sink, at the end of a run."""
+        if self.sink is not None:
+            self.flush()
+            self.sink.close()
+
+    def grow(self):
+        self.capacity *= 2
+        self.steps = np.resize(self.steps, self.capacity)
+        model_vars = np.empty((len(MODEL_METRICS), self.capacity))
+        model_vars[:, : self.count] = self.model_vars
+        self.model_vars = model_vars
+        agent_vars = np.empty((len(AGENT_METRICS), self.capacity, len(self.agent_ids)), dtype=self.dtype)
+        agent_vars[:, : self.count] = self.agent_vars
+        self.agent_vars = agent_vars
+
+    def stored(self, array, axis=0):
+        """The stored collections of ``array`` in chronological order (a view unless the ring wrapped)."""
+        if self.count <= self.capacity:
+            index = [slice(None)] * array.ndim
+            index[axis] = slice(0, self.count)
+            return array[tuple(index)]
+        return np.roll(array, -(self.count % self.capacity), axis=axis)
+
+    def model_columns(self):
+        """Dict metric -> array over the stored collections."""
+        return dict(zip(MODEL_METRICS, self.stored(self.model_vars, axis=1)))
+
+    def agent_columns(self):
+        """Dict metric -> flat array over (collection, agent), the layout of the agent dataframe."""
+        if self.agent_vars is None:
+            return {name: np.empty(0, dtype=self.dtype) for name in AGENT_METRICS}
+        values = self.stored(self.agent_vars, axis=1)
+        return {name: values[k].reshape(-1) for k, name in enumerate(AGENT_METRICS)}
+
+    def collected_steps(self):
+        return self.stored(self.steps)
+
+    def get_model_vars_dataframe(self):
+        """Model metrics indexed by step, like ``DataCollector.get_model_vars_dataframe``."""
+        index = pd.Index(self.collected_steps(), name="Step")
+        return pd.DataFrame(self.model_columns(), index=index, copy=False)
+
+    def get_agent_vars_dataframe(self):
+        """Agent metrics indexed by (Step, AgentID), like ``DataCollector.get_agent_vars_dataframe``."""
+        ids = self.agent_ids if self.agent_ids is not None else np.empty(0, dtype=np.int64)
+        index = pd.MultiIndex.from_arrays(
+            [np.repeat(self.collected_steps(), len(ids)), np.tile(ids, min(self.count, self.capacity))],
+            names=["Step", "AgentID"],
+        )
+        return pd.DataFrame(self.agent_columns(), index=index, copy=False)
+
+    def to_arrow(self, kind="model"):
+        """Model ("model") or agent ("agents") metrics as a ``pyarrow.Table``, without copying the columns."""
+        import pyarrow as pa
+
+        if kind == "model":
+            columns = {"Step": self.collected_steps(), **self.model_columns()}
+        else:
+            ids = self.agent_ids if self.agent_ids is not None else np.empty(0, dtype=np.int64)
+            n = min(self.count, self.capacity)
+            columns = {
+                "Step": np.repeat(self.collected_steps(), len(ids)),
+                "AgentID": np.tile(ids, n),
+                **self.agent_columns(),
+            }
+        return pa.table(columns)
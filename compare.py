@@ -0,0 +1,109 @@
+"""Lock-step comparison of the WEC models on one shared ocean.
+
+The dynamic, GP and static fleets are usually compared side by side. Run
+separately, each model builds and evolves its own copy of the same ocean; a
+``Comparison`` builds the ocean once, hands it to every model and advances it
+once per step after all of them moved. The field is computed once instead of
+once per model and every policy sees exactly the same sea, with the metrics
+of all the models aligned on the same steps.
+
+With the same seed the results are identical to runs of the single models.
+
+Example:
+    python compare.py --models WECswarm WECgp WECSTATIC --steps 500 \\
+        --set population_size=100 --set seed=3 --out comparison
+"""
+
+import argparse
+import inspect
+import os
+
+import pandas as pd
+
+from model import SwarmModel, make_ocean
+from runner import MODELS, parse_assignment
+
+
+def _default(name):
+    return inspect.signature(SwarmModel.__init__).parameters[name].default
+
+
+class Comparison:
+    """Several models advanced in lock-step on one ocean.
+
+    Args:
+        models: Names of the models (keys of ``runner.MODELS``) (default: all three)
+        **params: ``SwarmModel`` arguments common to every model; the ``ocean_*``
+            ones describe the shared ocean
+    """
+
+    def __init__(self, models=("WECswarm", "WECgp", "WECSTATIC"), **params):
+        ocean_params = {name[len("ocean_"):]: params.pop(name) for name in list(params) if name.startswith("ocean_")}
+        for name in ("width", "height", "seed"):
+            ocean_params[name] = params.get(name, _default(name))
+        self.ocean = make_ocean(**ocean_params)
+        self.models = {name: MODELS[name](ocean=self.ocean, **params) for name in models}
+        self.steps = 0
+
+    def step(self):
+        """Step every model on the current ocean, then evolve the ocean once."""
+        for model in self.models.values():
+            model.step()
+        self.ocean.update()
+        self.steps += 1
+
+    def run(self, steps):
+        for _ in range(steps):
+            self.step()
+
+    def close(self):
+        """Close the models, then the shared ocean (its files with ``ocean_memmap``)."""
+        for model in self.models.values():
+            model.close()
+        self.ocean.close()
+
+    def get_model_vars_dataframe(self):
+        """Model metrics indexed by step, one (model, metric) column each."""
+        return pd.concat(
+            {name: model.datacollector.get_model_vars_dataframe() for name, model in self.models.items()},
+            axis=1,
+            names=["Model", "Metric"],
+        )
+
+    def get_agent_vars_dataframe(self):
+        """Agent metrics indexed by (Model, Step, AgentID)."""
+        return pd.concat(
+            {name: model.datacollector.get_agent_vars_dataframe() for name, model in self.models.items()},
+            names=["Model"],
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the WEC models in lock-step on one ocean.")
+    parser.add_argument("--models", nargs="+", default=["WECswarm", "WECgp", "WECSTATIC"], choices=sorted(MODELS))
+    parser.add_argument("--steps", type=int, default=100, help="steps of the comparison")
+    parser.add_argument(
+        "--set", dest="assignments", action="append", type=parse_assignment, default=[],
+        metavar="NAME=VALUE", help="a model argument, common to every model (repeatable)",
+    )
+    parser.add_argument("--out", default="comparison", help="output directory")
+    args = parser.parse_args(argv)
+
+    params = {}
+    for name, values in args.assignments:
+        if len(values) != 1:
+            parser.error(f"{name} has several values, sweeps are done with runner.py")
+        params[name] = values[0]
+
+    comparison = Comparison(args.models, **params)
+    comparison.run(args.steps)
+
+    os.makedirs(args.out, exist_ok=True)
+    comparison.get_model_vars_dataframe().to_csv(os.path.join(args.out, "model.csv"))
+    comparison.get_agent_vars_dataframe().to_csv(os.path.join(args.out, "agents.csv"))
+    comparison.close()
+    print(f"{' '.join(comparison.models)} compared for {args.steps} steps, results in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
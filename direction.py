@@ -1,7 +1,14 @@
-from sklearn.gaussian_process import GaussianProcessRegressor
-from sklearn.gaussian_process.kernels import RBF
+from collections import OrderedDict
+
 import numpy as np
-from scipy.optimize import minimize
+from scipy.linalg import solve_triangular
+
+# Surrogate GP con kernel fisso: RBF(length_scale=3), rumore alpha, y normalizzata.
+# Nessuna ottimizzazione degli iperparametri: il fit è una Cholesky sul piccolo
+# insieme dei vicini e la media a posteriori ha gradiente analitico.
+LENGTH_SCALE = 3
+ALPHA = 1e-6
+ASCENT_STEPS = 8
 
 # Dati: X = punti in R^2, y = valori funzione
 def get_neighbours_data(neighbours):
@@ -10,33 +17,206 @@ def get_neighbours_data(neighbours):
     # print(Y)
     return X, Y
 
-def GP_fit(X, Y):   
-    # GP fitting
-    kernel = RBF(length_scale=3)
-    gp = GaussianProcessRegressor(kernel=kernel, alpha=1e-6, normalize_y=True)
-    gp.fit(X=X, y=Y)
-    return gp
-
-def dir(n, res):
-    delta = res.x - n.position
-    norm = np.linalg.norm(delta)
-    if norm == 0:
-        return np.array([0, 0])  # Restituisci una direzione di fallback
-    return np.divide(delta, norm)
-
-def get_direction(n, neighbours):
+def get_neighbours_ids(neighbours):
+    return np.array([n.unique_id for n in neighbours])
+
+def rbf(A, B, length_scale=LENGTH_SCALE):
+    """Kernel RBF tra A (..., n, 2) e B (..., m, 2) -> (..., n, m)."""
+    d2 = np.sum((A[..., :, np.newaxis, :] - B[..., np.newaxis, :, :]) ** 2, axis=-1)
+    return np.exp(-0.5 * d2 / length_scale ** 2)
+
+def GP_fit(X, Y):
+    """Fit in forma chiusa per un batch di vicinati della stessa taglia.
+
+    X (B, k, 2), Y (B, k). Ritorna (L, weights, y_mean, y_std) con L fattore di
+    Cholesky di K + alpha*I e weights = K^-1 y normalizzata.
+    """
+    L = kernel_cholesky(X)
+    y, y_mean, y_std = normalize(Y)
+    weights = cho_solve(L, y)
+    return L, weights, y_mean, y_std
+
+def normalize(Y):
+    """Normalizzazione di y come normalize_y=True di sklearn (std nulla -> 1)."""
+    y_mean = np.mean(Y, axis=-1, keepdims=True)
+    y_std = np.std(Y, axis=-1, keepdims=True)
+    y_std[y_std == 0] = 1
+    return (Y - y_mean) / y_std, y_mean, y_std
+
+def kernel_cholesky(X):
+    K = rbf(X, X)
+    K += ALPHA * np.eye(X.shape[-2])
+    return np.linalg.cholesky(K)
+
+def cho_solve(L, y):
+    """Risolve (L L^T) w = y per un batch di fattori L (B, k, k) e y (B, k)."""
+    z = np.linalg.solve(L, y[..., np.newaxis])
+    return np.linalg.solve(np.swapaxes(L, -1, -2), z)[..., 0]
+
+def GP_mean(x, X, weights, y_mean, y_std):
+    """Media a posteriori nei punti x (B, 2)."""
+    k = rbf(x[:, np.newaxis, :], X)[:, 0, :]
+    return np.sum(k * weights, axis=-1) * y_std[:, 0] + y_mean[:, 0]
+
+def GP_mean_gradient(x, X, weights, y_std):
+    """Gradiente analitico della media a posteriori nei punti x (B, 2)."""
+    diff = x[:, np.newaxis, :] - X
+    k = np.exp(-0.5 * np.sum(diff ** 2, axis=-1) / LENGTH_SCALE ** 2)
+    grad = -np.sum((k * weights)[..., np.newaxis] * diff, axis=1) / LENGTH_SCALE ** 2
+    return grad * y_std
+
+def get_directions(points, X, Y, vision):
+    """Direzione verso il massimo della media GP per un batch di agenti.
+
+    points (B, 2) posizioni degli agenti, X (B, k, 2) e Y (B, k) posizioni e potenze
+    dei loro k vicini, vision (B,) semi-lato del box di ricerca. Qualche passo di
+    salita del gradiente con backtracking; direzione nulla se la media è piatta.
+    """
+    L, weights, y_mean, y_std = GP_fit(X, Y)
+    return ascend(points, X, weights, y_mean, y_std, vision)
+
+def ascend(points, X, weights, y_mean, y_std, vision):
+    """Salita del gradiente sulla media a posteriori già fittata, dentro il box +- vision."""
+    points = np.asarray(points, dtype=float)
+    vision = np.broadcast_to(np.asarray(vision, dtype=float), (len(points),))[:, np.newaxis]
+    low, high = points - vision, points + vision
+
+    x = points.copy()
+    value = GP_mean(x, X, weights, y_mean, y_std)
+    step = np.full(len(points), float(LENGTH_SCALE))
+    for _ in range(ASCENT_STEPS):
+        grad = GP_mean_gradient(x, X, weights, y_std)
+        norm = np.linalg.norm(grad, axis=1)
+        moving = norm > 0
+        candidate = x.copy()
+        candidate[moving] += (step[moving] / norm[moving])[:, np.newaxis] * grad[moving]
+        np.clip(candidate, low, high, out=candidate)
+        candidate_value = GP_mean(candidate, X, weights, y_mean, y_std)
+        better = moving & (candidate_value > value)
+        x[better] = candidate[better]
+        value[better] = candidate_value[better]
+        step[~better] *= 0.5
+
+    delta = x - points
+    norm = np.linalg.norm(delta, axis=1)
+    directions = np.zeros_like(delta)
+    found = norm > 0
+    directions[found] = delta[found] / norm[found][:, np.newaxis]
+    return directions
+
+def chol_update(L, v):
+    """Fattore di Cholesky di L L^T + v v^T (aggiornamento di rango 1, O(k^2))."""
+    L = L.copy()
+    v = v.copy()
+    for k in range(len(v)):
+        r = np.hypot(L[k, k], v[k])
+        c = r / L[k, k]
+        s = v[k] / L[k, k]
+        L[k, k] = r
+        L[k + 1:, k] = (L[k + 1:, k] + s * v[k + 1:]) / c
+        v[k + 1:] = c * v[k + 1:] - s * L[k + 1:, k]
+    return L
+
+def chol_delete(L, p):
+    """Fattore di Cholesky della matrice senza la riga e la colonna p."""
+    trailing = chol_update(L[p + 1:, p + 1:], L[p + 1:, p])
+    L = np.delete(np.delete(L, p, axis=0), p, axis=1)
+    L[p:, p:] = trailing
+    return L
+
+def chol_append(L, X, x):
+    """Fattore di Cholesky del kernel con il punto x aggiunto in fondo a X."""
+    n = len(X)
+    c = solve_triangular(L, rbf(X, x[np.newaxis])[:, 0], lower=True) if n else np.empty(0)
+    d2 = 1 + ALPHA - c @ c
+    if not d2 > 0:
+        raise np.linalg.LinAlgError("kernel matrix is not positive definite")
+    new = np.zeros((n + 1, n + 1))
+    new[:n, :n] = L
+    new[n, :n] = c
+    new[n, n] = np.sqrt(d2)
+    return new
+
+class GPState:
+    """Fattorizzazione di Cholesky del vicinato di un agente, tenuta tra uno step e l'altro.
+
+    I vicini che escono (o si spostano più di ``tolerance``) sono tolti con un downdate,
+    quelli nuovi aggiunti in fondo; per gli altri si aggiornano solo i valori y.
+    Se cambia più di metà del vicinato conviene rifattorizzare da capo.
+    """
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.X = np.empty((0, 2))
+        self.L = np.empty((0, 0))
+
+    def refit(self, ids, X):
+        self.ids = np.asarray(ids)
+        self.X = np.array(X, dtype=float)
+        self.L = kernel_cholesky(self.X)
+
+    def update(self, ids, X, tolerance=0.0):
+        """Allinea la fattorizzazione ai vicini (ids, X).
+
+        Ritorna le righe di (ids, X) nell'ordine di ``self.ids``, per riordinare Y.
+        """
+        rows = {i: r for r, i in enumerate(ids.tolist())}
+        stay = [
+            r for r, i in enumerate(self.ids.tolist())
+            if i in rows and np.linalg.norm(self.X[r] - X[rows[i]]) <= tolerance
+        ]
+        kept = set(self.ids[stay].tolist())
+        added = [r for i, r in rows.items() if i not in kept]
+        removed = len(self.ids) - len(stay)
+
+        if removed + len(added) > len(ids) // 2:
+            self.refit(ids, X)
+            return np.arange(len(ids))
+        try:
+            L = self.L
+            stay_set = set(stay)
+            for r in reversed(range(len(self.ids))):
+                if r not in stay_set:
+                    L = chol_delete(L, r)
+            ids_new = self.ids[stay]
+            X_new = self.X[stay]
+            for r in added:
+                L = chol_append(L, X_new, X[r])
+                ids_new = np.append(ids_new, ids[r])
+                X_new = np.vstack([X_new, X[r]])
+        except np.linalg.LinAlgError:
+            self.refit(ids, X)
+            return np.arange(len(ids))
+        self.ids, self.X, self.L = ids_new, X_new, L
+        return np.array([rows[i] for i in self.ids.tolist()], dtype=np.intp)
+
+class GPCache:
+    """Stati GP per agente con politica LRU: al massimo ``maxsize`` fattorizzazioni in memoria."""
+
+    def __init__(self, maxsize=1000, tolerance=0.1):
+        self.maxsize = maxsize
+        self.tolerance = tolerance
+        self.states = OrderedDict()
+
+    def get(self, key):
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = GPState()
+            while len(self.states) > self.maxsize:
+                self.states.popitem(last=False)
+        else:
+            self.states.move_to_end(key)
+        return state
+
+def get_direction(n, neighbours, cache=None):
     X, Y = get_neighbours_data(neighbours=neighbours)
     # print(X, Y)
-    gp = GP_fit(X, Y)
-    def gp_neg(x):
-        x = np.array(x).reshape(1, -1)
-        y_pred, _ = gp.predict(x, return_std=True)
-        return -y_pred[0]
-    res = minimize(gp_neg, x0=n.position, bounds=[(n.position[0] - n.vision, n.position[0] + n.vision), 
-        (n.position[1] - n.vision, n.position[1] + n.vision)])
-    
-    if res.success:
-        return dir(n, res)
-    else:
-        # Restituisci una direzione predefinita o gestisci l'errore come meglio credi
-        return np.array([0, 0])  # Direzione di fallback
+    if cache is None:
+        return get_directions(np.array([n.position]), X[np.newaxis], Y[np.newaxis], n.vision)[0]
+
+    # fattorizzazione riusata dallo step precedente, si rinfrescano solo i valori y
+    state = cache.get(n.unique_id)
+    rows = state.update(get_neighbours_ids(neighbours), X, tolerance=cache.tolerance)
+    y, y_mean, y_std = normalize(Y[rows][np.newaxis])
+    weights = cho_solve(state.L[np.newaxis], y)
+    return ascend(np.array([n.position]), state.X[np.newaxis], weights, y_mean, y_std, n.vision)[0]
@@ -0,0 +1,232 @@
+"""Vectorized swarm engine.
+
+Structure-of-arrays implementation of the WEC rules in ``agents.py``. The
+state of the whole population (position, direction, speed, battery, load,
+harvested energy, ...) lives in contiguous numpy arrays owned by the model
+(``space.agent_positions``, ``model.directions``, ``model.agent_arrays``), the
+same the agent objects read their attributes from, and every phase of ``SwarmAgent.step`` is applied to all agents at once. Neighbors
+come in bulk from the model's ``SpatialIndex``.
+
+Differently from ``shuffle_do("step")`` the update is synchronous: every agent
+senses the swarm as it was at the beginning of the step, so the result does
+not depend on the activation order and is fully reproducible under a seed.
+"""
+
+import numpy as np
+
+from direction import get_directions
+from separation import separation_many
+
+
+class SwarmEngine:
+    """Batched WEC dynamics over the agents of a model.
+
+    Row ``i`` of every array refers to ``space.active_agents[i]``; nothing is
+    copied, the engine updates in place the arrays of the model the agents
+    read their state from.
+    """
+
+    def __init__(self, model, policy=None):
+        """Collect the state of the agents already placed in ``model.space``.
+
+        Args:
+            model: Model instance owning the agents, the space and the ocean
+            policy: Name of the ``DirectionPolicy`` to apply: "target" (towards the
+                neighbor with the highest power, like WEC), "gp" (towards the maximum
+                of the GP surrogate of the neighbors' power, like GP) or "static"
+                (moored, like STATIC) (default: the policy of ``model.agent_class``)
+        """
+        self.model = model
+        self.policy = policy if policy is not None else model.agent_class.policy.name
+        self.mobile = self.policy != "static"
+        self.space = model.space
+        self.agents = list(self.space.active_agents)
+
+        # shared with the agents, every rule below writes them in place
+        arrays = model.agent_arrays
+        self.direction = model.directions
+        self.max_speed = arrays.max_speed
+        self.speed = arrays.speed
+        self.vision = arrays.vision
+        self.min_separation = arrays.min_separation
+        self.separation = arrays.separation
+        self.power = arrays.power
+        self.battery = arrays.battery
+        self.consume = arrays.consume
+        self.efficiency = arrays.efficiency
+        self.WEC_power = arrays.WEC_power
+        self.load = arrays.load
+        self.energy_harvested = arrays.energy_harvested
+        self.mean_energy_harvested = arrays.mean_energy_harvested
+        self.total_energy_harvested = arrays.total_energy_harvested
+        self.step_number = arrays.step_number
+        self.count_agent_in_zone = arrays.count_agent_in_zone
+        self.n_neighbors = arrays.n_neighbors
+
+        # neighbor pairs of the last step, sorted by (i, j)
+        self.pairs_i = np.empty(0, dtype=np.intp)
+        self.pairs_j = np.empty(0, dtype=np.intp)
+        self.pairs_d = np.empty(0, dtype=float)
+
+    @property
+    def position(self):
+        return self.space.agent_positions
+
+    def __len__(self):
+        return len(self.agents)
+
+    def step(self):
+        """Advance every agent by one step, phase by phase like ``SwarmAgent.step``."""
+        if len(self) == 0:
+            return
+        position = self.position
+        self.sense(position)
+        self.charge()
+        if not self.mobile:
+            return
+        self.get_separation()
+        # steer only the agents that see somebody
+        self.steer(position)
+        self.move(position)
+
+    # --- phases -------------------------------------------------------------
+
+    def sense(self, position):
+        """Neighbor pairs, speed and power at the current positions."""
+        if self.mobile:
+            self.step_number += 1
+            self.zone_counting(position)
+            self.model.spatial_index.rebuild()
+            i, j, d = self.model.spatial_index.pairs(self.vision)
+            self.pairs_i, self.pairs_j, self.pairs_d = i, j, d
+            self.n_neighbors[:] = np.bincount(i, minlength=len(self))
+            self.get_speed()
+        self.model.power.get_power_many(position, out=self.power)
+
+    def charge(self):
+        """Battery (or load, for moored WECs) and harvested energy."""
+        if self.mobile:
+            self.get_battery()
+        else:
+            np.multiply(self.efficiency, self.power, out=self.load)
+        self.energy_hervesting()
+
+    def steer(self, position):
+        self.get_direction(position)
+
+    # --- rules --------------------------------------------------------------
+
+    def zone_counting(self, position):
+        x, y = position[:, 0], position[:, 1]
+        self.count_agent_in_zone += (x > 40) & (x < 60) & (y > 40) & (y < 60)
+
+    def get_speed(self):
+        self.speed[:] = self.max_speed * (1 - ((60 - self.battery) ** 2) / 3600)
+        self.speed[self.battery < 5] = 0
+
+    def get_consume(self):
+        battery = self.battery
+        self.load[:] = np.where(
+            battery > 80,
+            0.6,
+            np.where(
+                battery < 20,
+                np.where(battery < 5, 0.05, 0.1),
+                0.2 + (battery / 100 - 0.2) ** 2,
+            ),
+        )
+        np.maximum(self.load, 0, out=self.load)
+        return (self.speed ** 3) * self.consume + self.load
+
+    def get_battery(self):
+        self.WEC_power[:] = self.efficiency * self.power - self.get_consume()
+        np.clip(self.battery + self.WEC_power, 0, 100, out=self.battery)
+
+    def neighbor_mean(self, values):
+        """Mean of ``values`` over the neighbors of each agent (nan if none)."""
+        n = len(self)
+        sums = np.bincount(self.pairs_i, weights=values[self.pairs_j], minlength=n)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / self.n_neighbors
+
+    def energy_hervesting(self):
+        self.energy_harvested[:] = self.power
+        self.total_energy_harvested += self.energy_harvested
+        if self.mobile:
+            self.mean_energy_harvested[:] = self.neighbor_mean(self.energy_harvested)
+
+    def get_separation(self):
+        self.separation[:] = separation_many(
+            self.min_separation, self.power, self.power[self.pairs_j], self.n_neighbors
+        )
+
+    def first_per_agent(self, i, j):
+        """For pairs sorted by agent, return the agents and their first partner."""
+        if len(i) == 0:
+            return i, j
+        first = np.flatnonzero(np.r_[True, i[1:] != i[:-1]])
+        return i[first], j[first]
+
+    def get_direction(self, position):
+        i, j, d = self.pairs_i, self.pairs_j, self.pairs_d
+        in_crowd = d < self.separation[i]
+        has_crowd = np.bincount(i[in_crowd], minlength=len(self)) > 0
+
+        # agoraphobic: escape from the first agent of the crowd
+        repel = has_crowd & (self.battery >= 10)
+        crowd_i, crowd_j = self.first_per_agent(i[in_crowd], j[in_crowd])
+        keep = repel[crowd_i]
+        crowd_i, crowd_j = crowd_i[keep], crowd_j[keep]
+
+        seek = (self.n_neighbors > 0) & ~repel
+        if self.policy == "gp":
+            self.gp_direction(position, np.flatnonzero(seek))
+        else:
+            self.target_direction(position, seek)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = position[crowd_j] - position[crowd_i]
+            self.direction[crowd_i] = -delta / np.linalg.norm(delta, axis=1)[:, np.newaxis]
+
+    def target_direction(self, position, seek):
+        # target: neighbor with the highest power (the first one on ties)
+        i, j = self.pairs_i, self.pairs_j
+        pick = seek[i]
+        ti, tj = i[pick], j[pick]
+        order = np.lexsort((tj, -self.power[tj], ti))
+        target_i, target_j = self.first_per_agent(ti[order], tj[order])
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = position[target_j] - position[target_i]
+            self.direction[target_i] = delta / np.linalg.norm(delta, axis=1)[:, np.newaxis]
+
+    def gp_direction(self, position, seekers):
+        # one batched GP fit for all the agents with the same number of neighbors
+        starts = np.searchsorted(self.pairs_i, seekers)
+        counts = self.n_neighbors[seekers]
+        for k in np.unique(counts):
+            same = counts == k
+            group = seekers[same]
+            neighbors = self.pairs_j[starts[same][:, np.newaxis] + np.arange(k)]
+            self.direction[group] = get_directions(
+                position[group], position[neighbors], self.power[neighbors], self.vision[group]
+            )
+
+    def move(self, position):
+        speed = self.speed[:, np.newaxis]
+        new_position = position + self.direction * speed
+        bounds = self.space.dimensions
+        for axis in range(2):
+            out = (new_position[:, axis] < bounds[axis, 0]) | (new_position[:, axis] > bounds[axis, 1])
+            self.direction[out, axis] = -self.direction[out, axis]
+            new_position[out, axis] = position[out, axis] + self.direction[out, axis] * self.speed[out]
+
+        inside = (new_position >= bounds[:, 0]) & (new_position <= bounds[:, 1])
+        if not inside.all():
+            point = new_position[np.flatnonzero(~inside.all(axis=1))[0]]
+            raise ValueError(f"point {point} is outside the bounds of the space")
+        position[:] = new_position
+
+    def sync_agents(self):
+        """Store the neighbors of the last step for the agent objects (their state is already shared)."""
+        self.model.agent_arrays.set_neighbors(self.n_neighbors, self.pairs_j, self.pairs_d)
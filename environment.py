@@ -1,32 +1,182 @@
+import os
+import shutil
+import tempfile
+import weakref
+
 import numpy as np
 from scipy.ndimage import gaussian_filter
 from matplotlib import pyplot as plt
 
 from mesa.space import PropertyLayer
 
+from scenario import Scenario
+
+
+
+
+class SmoothNoise:
+    """Rumore bianco gaussiano filtrato con un kernel gaussiano, nel dominio di Fourier.
+
+    Equivalente a ``gaussian_filter(rng.standard_normal(shape) * scale, sigma)`` con i
+    bordi riflessi (mode="reflect"): il rumore viene esteso per riflessione di ``4 sigma``
+    per lato (il raggio del kernel di gaussian_filter), filtrato con la funzione di
+    trasferimento della griglia estesa e ritagliato. La convoluzione della FFT è
+    periodica, ma l'estensione tiene il kernel lontano dal lato opposto.
+
+    La funzione di trasferimento è calcolata una volta sola e solo le colonne della banda
+    che il filtro lascia passare vengono trasformate: rfft lungo il secondo asse, fft,
+    filtro e ifft lungo il primo sulle sole colonne della banda, irfft con zero padding.
+    """
 
+    def __init__(self, shape, sigma, scale, rng, cutoff=1e-8, dtype=np.float64):
+        self.shape = shape
+        self.sigma = sigma
+        self.scale = scale
+        self.rng = rng
+        self.dtype = np.dtype(dtype)
+        self.pad = int(4 * sigma + 0.5)   # raggio del kernel di gaussian_filter (truncate=4)
+        n1, n2 = (n + 2 * self.pad for n in shape)
+        self.padded_shape = (n1, n2)
+        f1 = np.fft.fftfreq(n1)[:, np.newaxis]
+        f2 = np.fft.rfftfreq(n2)[np.newaxis, :]
+        transfer = np.exp(-2 * np.pi ** 2 * sigma ** 2 * (f1 ** 2 + f2 ** 2))
+
+        band = np.nonzero((transfer > cutoff).any(axis=0))[0]
+        self.columns = band.max() + 1 if len(band) else 1
+        self.transfer = transfer[:, : self.columns] * scale
+        complex_dtype = np.result_type(self.dtype, np.complex64)
+        self.work = np.zeros((n1, self.columns), dtype=complex_dtype)
+
+    def sample(self, out=None):
+        """Nuovo campo di rumore, scritto in ``out`` (shape ``self.shape``) se dato."""
+        noise = np.pad(self.rng.standard_normal(self.shape), self.pad, mode="symmetric")   # reflect di scipy
+        # stessi passi di irfft2(rfft2(noise) * transfer), le colonne fuori banda valgono zero
+        self.work[:] = np.fft.rfft(noise, axis=1)[:, : self.columns]
+        np.fft.fft(self.work, axis=0, out=self.work)
+        self.work *= self.transfer
+        np.fft.ifft(self.work, axis=0, out=self.work)
+        field = np.fft.irfft(self.work, n=self.padded_shape[1], axis=1)
+        crop = field[self.pad : self.pad + self.shape[0], self.pad : self.pad + self.shape[1]]
+        if out is None:
+            return crop.astype(self.dtype)
+        np.copyto(out, crop)
+        return out
 
 
 class Ocean(PropertyLayer):
-    def __init__(self,  width: int = 100, height: int = 100, max_power:int = 1, seed: int = 42):
-        super().__init__(name="Ocean", width=width, height=height, default_value=1)
+    """Campo di potenza delle onde, evoluto nel tempo con perturbazioni gaussiane lisce.
+
+    Args:
+        update_every: Il campo evolve una volta ogni ``update_every`` step del modello
+        interpolate: Se True, ogni ``update_every`` step si calcola il prossimo campo chiave
+            e negli step intermedi il campo è la miscela lineare dei due campi chiave
+        lazy: Se True, ``update`` fa solo avanzare il tempo e il campo viene ricalcolato
+            quando qualcuno lo campiona (``get_power``, ``get_power_many``, ``refresh``),
+            applicando una dopo l'altra le evoluzioni saltate: il campo è lo stesso di
+            quello calcolato subito. Un modello campiona l'oceano a ogni step (PowerCache),
+            quindi lazy fa risparmiare solo quando l'oceano non viene letto a ogni
+            aggiornamento, per esempio da chi lo campiona dall'esterno di tanto in tanto
+        dtype: Tipo dei campi, np.float32 dimezza la memoria
+        memmap: Cartella in cui tenere i campi come ``np.memmap`` invece che in RAM; ogni
+            oceano usa una sua sottocartella, cancellata da ``close`` (o, al più tardi,
+            quando l'oceano viene liberato dal garbage collector)
+        scenario: Cartella di uno scenario pre-calcolato (``scenario.py``): le evoluzioni
+            vengono lette dai suoi fotogrammi invece di essere simulate
+
+    Il campo, i due campi chiave (con interpolate) e il campo di lavoro del rumore sono
+    allocati una volta sola; ogni evoluzione lavora sul posto in questi buffer.
+    """
+
+    def __init__(self,  width: int = 100, height: int = 100, max_power:int = 1, seed: int = 42,
+                 update_every: int = 1, interpolate: bool = False, lazy: bool = False,
+                 dtype=np.float64, memmap: str = None, scenario: str = None):
+        self.dtype = np.dtype(dtype)
+        # la griglia 1x1 di PropertyLayer viene subito sostituita da quella allocata in buffer()
+        super().__init__(name="Ocean", width=1, height=1, default_value=self.dtype.type(1), dtype=self.dtype.type)
         self.width = width
         self.height = height
+        self.memmap = memmap
+        self.directory = None
+        if memmap is not None:
+            # cartella propria dentro memmap: più oceani (worker di runner.py, checkpoint
+            # caricati accanto a un modello vivo) non si sovrascrivono i file a vicenda
+            os.makedirs(memmap, exist_ok=True)
+            self.directory = tempfile.mkdtemp(prefix="ocean_", dir=memmap)
+            # close() la cancella subito, altrimenti quando l'oceano viene liberato
+            self.finalizer = weakref.finalize(self, shutil.rmtree, self.directory, ignore_errors=True)
+        self.buffers = {}
+        self.data = self.buffer("data")
+        self.data.fill(1)
         self.max_power = max_power
         # self.power = self.create_env()
         self.sigma = 15
         self.index=1
         self.seed = seed
+        self.rng = np.random.default_rng(seed)  # generatore proprio, non tocca np.random globale
+        self.noise = None
+        self.version = 0    # cambia ogni volta che il campo viene riscritto
+
+        # schedule dell'evoluzione
+        self.update_every = max(1, int(update_every))
+        self.interpolate = interpolate
+        self.lazy = lazy
+        self.time = 0           # step del modello visti da update
+        self.evolutions = 0     # evoluzioni del campo già applicate
+        self.keyframes = None   # [campo chiave corrente, campo chiave successivo]
+        self.dirty = False
 
+        self.scenario = Scenario(scenario) if scenario is not None else None
+        if self.scenario is not None and self.scenario.shape != (width, height):
+            raise ValueError(f"scenario {scenario} is {self.scenario.shape}, the ocean is {(width, height)}")
+
+    def set_cells(self, value, condition=None):
+        super().set_cells(value, condition=condition)
+        self.version += 1
+
+    def buffer(self, name):
+        """Campo (width, height) ``name``, allocato alla prima richiesta (in RAM o su file)."""
+        if name not in self.buffers:
+            shape = (self.width, self.height)
+            if self.memmap is None:
+                self.buffers[name] = np.empty(shape, dtype=self.dtype)
+            else:
+                path = os.path.join(self.directory, f"{name}.dat")
+                self.buffers[name] = np.memmap(path, dtype=self.dtype, mode="w+", shape=shape)
+        return self.buffers[name]
+
+    def close(self):
+        """Cancella i file dei campi (con memmap); dopo close l'oceano non è più utilizzabile."""
+        if self.directory is None:
+            return
+        # i memmap vanno rilasciati prima di cancellare i file (su Windows restano bloccati)
+        self.buffers.clear()
+        self.data = self.keyframes = None
+        self.finalizer()
 
 
     def modify_ocean(self):
-        np.random.seed(self.seed)   #same initial ocean for both environment
-        rand_power = np.random.rand(self.width, self.height)
-        power_distribution = gaussian_filter(rand_power, sigma=self.sigma)  # più sigma = più liscio
-        norm = np.dot(np.divide(power_distribution - np.min(power_distribution), np.max(power_distribution) - np.min(power_distribution)), self.max_power)
+        if self.scenario is not None:
+            # campo pre-calcolato: si riparte dal fotogramma dell'evoluzione corrente
+            self.keyframes = None
+            self.evolutions = self.time // self.update_every
+            self.dirty = False
+            self.scenario.read(self.evolutions, out=self.data)
+            self.version += 1
+            return
+        # stesso oceano iniziale per entrambi gli ambienti, senza riseminare np.random globale
+        rand_power = np.random.RandomState(self.seed).rand(self.width, self.height)
+        power_distribution = gaussian_filter(rand_power, sigma=self.sigma, output=rand_power)  # più sigma = più liscio
+        # normalizzazione sul posto, nessun'altra copia del campo
+        low = np.min(power_distribution)
+        high = np.max(power_distribution)
+        power_distribution -= low
+        power_distribution /= high - low
+        power_distribution *= self.max_power
 
-        self.set_cells(value=norm)
+        self.set_cells(value=power_distribution)
+        self.keyframes = None
+        self.evolutions = self.time // self.update_every
+        self.dirty = False
         return 
 
     def bilinear_interpolation(self, pos):
@@ -51,11 +201,11 @@ class Ocean(PropertyLayer):
         dx = x - x0
         dy = y - y0
 
-        # Valori nei 4 angoli
-        Q11 = self.data[x0, y0]
-        Q21 = self.data[x0, y1]
-        Q12 = self.data[x1, y0]
-        Q22 = self.data[x1, y1]
+        # Valori nei 4 angoli (in float64 anche se il campo è float32)
+        Q11 = np.float64(self.data[x0, y0])
+        Q21 = np.float64(self.data[x0, y1])
+        Q12 = np.float64(self.data[x1, y0])
+        Q22 = np.float64(self.data[x1, y1])
 
         # Interpolazione bilineare
         value = value = (
@@ -66,25 +216,125 @@ class Ocean(PropertyLayer):
         )
         return value
 
+    def bilinear_interpolation_many(self, positions, out=None):
+        """
+        Versione vettoriale di bilinear_interpolation per un array di posizioni (N, 2).
+        Stesso clamping ai bordi e stessa formula, un solo gather per tutto lo sciame.
+        Gli indici sono limitati alla griglia: un punto esattamente sull'ultima riga
+        o colonna non legge fuori dall'array. I valori sono sempre float64.
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        if out is None:
+            out = np.empty(len(positions), dtype=float)
+
+        x = positions[:, 1].copy()
+        y = positions[:, 0].copy()
+        x[x > self.width - 1] -= 1
+        y[y > self.height - 1] -= 1
+
+        x0 = np.floor(x).astype(np.intp)
+        y0 = np.floor(y).astype(np.intp)
+        x1 = np.minimum(x0 + 1, self.data.shape[0] - 1)
+        y1 = np.minimum(y0 + 1, self.data.shape[1] - 1)
+
+        dx = x - x0
+        dy = y - y0
+
+        # stessa combinazione dei 4 angoli del caso scalare
+        out[:] = self.data[x0, y0] * (1 - dx) * (1 - dy)
+        out += self.data[x0, y1] * dx * (1 - dy)
+        out += self.data[x1, y0] * (1 - dx) * dy
+        out += self.data[x1, y1] * dx * dy
+        return out
+
     def get_power(self, pos):
+        if self.dirty:
+            self.refresh()
         power = self.bilinear_interpolation(pos=pos)
         return power
+
+    def get_power_many(self, positions, out=None):
+        """Power at every row of ``positions`` (N, 2), optionally written into ``out``."""
+        if self.dirty:
+            self.refresh()
+        return self.bilinear_interpolation_many(positions=positions, out=out)
  
-    def update(self):
-        # Crea una perturbazione casuale      
+    def smooth_noise(self):
+        if self.noise is None or self.noise.sigma != self.sigma or self.noise.shape != self.data.shape:
+            self.noise = SmoothNoise(self.data.shape, sigma=self.sigma, scale=0.15, rng=self.rng, dtype=self.dtype)
+        return self.noise
+
+    def evolve(self, field, out=None):
+        """Nuovo campo: ``field`` più una perturbazione liscia, riportato in [0, max_power].
+
+        Il risultato è scritto in ``out`` (può essere ``field`` stesso), altrimenti in un nuovo array.
+        """
+        # Crea una perturbazione casuale già filtrata (come gaussian_filter con bordi riflessi, sigma=self.sigma)
+        noise = self.smooth_noise().sample(out=self.buffer("noise"))
 
-        self.index += 1
-        np.random.seed(self.index)
-        perturbation = np.random.randn(self.width, self.height) * 0.15   
-        self.index+=1   #changing the random number during the time
-    
         # Applica la perturbazione alla distribuzione attuale
-        power_distribution = self.data + gaussian_filter(perturbation, sigma=self.sigma)
-        # Ritaglia ai limiti di [0, self.max_power] per evitare overflow
-        norm = np.dot(np.divide(power_distribution - np.min(power_distribution), np.max(power_distribution) - np.min(power_distribution)), self.max_power)
-     
-    
-        self.set_cells(value=norm)
+        power_distribution = np.add(noise, field, out=out)
+        # Riporta ai limiti di [0, self.max_power], senza copie intermedie
+        low = power_distribution.min()
+        high = power_distribution.max()
+        power_distribution -= low
+        power_distribution *= self.max_power / (high - low)
+        return power_distribution
+
+    def evolve_to(self, field, evolution, steps, out):
+        """Campo dell'evoluzione ``evolution``, ``steps`` evoluzioni dopo ``field``: simulato o letto dallo scenario.
+
+        Le evoluzioni simulate sono applicate una alla volta, come se il campo fosse stato
+        aggiornato a ogni evoluzione (ognuna viene riportata in [0, max_power]).
+        """
+        if self.scenario is not None:
+            return self.scenario.read(evolution, out=out)
+        for _ in range(steps):
+            field = self.evolve(field, out=out)
+        return field
+
+    def update(self):
+        """Avanza di uno step del modello; il campo segue lo schedule (subito, o al primo campionamento se lazy)."""
+        self.index += 1
+        self.time += 1
+        self.dirty = True
+        if not self.lazy:
+            self.refresh()
+        return
+
+    def refresh(self):
+        """Porta il campo al tempo corrente applicando le evoluzioni in sospeso."""
+        if not self.dirty:
+            return
+        self.dirty = False
+        due = self.time // self.update_every - self.evolutions
+
+        if not self.interpolate:
+            if due > 0:
+                self.evolve_to(self.data, self.evolutions + due, steps=due, out=self.data)
+                self.evolutions += due
+                self.version += 1
+            return
+
+        if self.keyframes is None:
+            start, end = self.buffer("keyframe0"), self.buffer("keyframe1")
+            np.copyto(start, self.data)
+            self.keyframes = [start, self.evolve_to(start, self.evolutions + 1, steps=1, out=end)]
+        if due > 0:
+            # il campo chiave successivo diventa quello corrente, il vecchio buffer riceve il nuovo
+            previous, following = self.keyframes
+            if due > 1:
+                self.evolve_to(following, self.evolutions + due, steps=due - 1, out=following)
+            self.keyframes = [following, self.evolve_to(following, self.evolutions + due + 1, steps=1, out=previous)]
+            self.evolutions += due
+
+        # miscela lineare tra i due campi chiave, scritta direttamente in self.data
+        start, end = self.keyframes
+        t = (self.time - self.evolutions * self.update_every) / self.update_every
+        np.subtract(end, start, out=self.data)
+        self.data *= t
+        self.data += start
+        self.version += 1
         return
     
     def test_plot(self):
@@ -95,4 +345,38 @@ class Ocean(PropertyLayer):
     
     def plot(self, ax):
         ax.imshow(self.data, cmap='viridis')
-        ax.colorbar()
\ No newline at end of file
+        ax.colorbar()
+
+
+class PowerCache:
+    """Power of the ocean at the agents' positions, memoized per step.
+
+    The whole swarm is sampled in one batch the first time a value is read after
+    the ocean changed (``Ocean.version``); an agent that moved since is
+    re-sampled alone on its next read. Values are identical to ``Ocean.get_power``.
+    """
+
+    def __init__(self, ocean, space):
+        self.ocean = ocean
+        self.space = space
+        self.version = None
+        self.positions = np.empty((0, 2))
+        self.values = np.empty(0)
+
+    def refresh(self):
+        positions = self.space.agent_positions
+        self.positions = positions.copy()
+        self.values = self.ocean.get_power_many(positions)
+        self.version = self.ocean.version
+
+    def get(self, agent):
+        self.ocean.refresh()
+        if self.version != self.ocean.version or len(self.values) != self.space._n_agents:
+            self.refresh()
+        index = self.space._agent_to_index[agent]
+        position = self.space.agent_positions[index]
+        cached = self.positions[index]
+        if position[0] != cached[0] or position[1] != cached[1]:
+            cached[:] = position
+            self.values[index] = self.ocean.get_power(position)
+        return self.values[index]
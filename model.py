@@ -3,6 +3,9 @@ Boids Flocking Model
 ===================
 A Mesa implementation of Craig Reynolds's Boids flocker model.
 Uses numpy arrays to represent vectors.
+
+``SwarmModel`` holds everything the WEC models share; ``WECswarm``, ``WECgp``
+and ``WECSTATIC`` only choose the agent class, hence the direction policy.
 """
 
 import os
@@ -14,150 +17,60 @@ sys.path.insert(0, os.path.abspath("../../../.."))
 import numpy as np
 from numpy.random import default_rng
 
-from mesa import Model, DataCollector
-from agents import WEC, GP, STATIC
+from mesa import Model
+from agents import WEC, GP, STATIC, AgentArrays
 from mesa.experimental.continuous_space import ContinuousSpace
 
-from environment import Ocean
-
-
-class WECswarm(Model):
-    """Flocker model class. Handles agent creation, placement and scheduling."""
-
-    def __init__(
-        self,
-        population_size=100,
-        width=100,
-        height=100,
-        speed=1,
-        vision=20,
-        separation=5,
-        efficiency=0.6,
-        consume=1,
-        battery=30,
-        load = 0,
-        seed=10,
-    ):
-        """Create a new Boids Flocking model.
-
-        Args:
-            population_size: Number of Boids in the simulation (default: 100)
-            width: Width of the space (default: 100)
-            height: Height of the space (default: 100)
-            speed: How fast the Boids move (default: 1)
-            vision: How far each Boid can see (default: 10)
-            separation: Minimum distance between Boids (default: 2)
-            cohere: Weight of cohesion behavior (default: 0.03)
-            separate: Weight of separation behavior (default: 0.015)
-            match: Weight of alignment behavior (default: 0.05)
-            seed: Random seed for reproducibility (default: None)
-        """
-        super().__init__(seed=seed)
-        self.rng = default_rng(seed=seed)                #To make the initial positioning of the agents in the Static and Dynamic environment simillar we add this
-
-        self.cumulative_load = 0.0
-
-        # Set up the space
-        self.space = ContinuousSpace(
-            [[0, width], [0, height]],
-            torus=False,
-            random=self.random,
-            n_agents=population_size,
+from environment import Ocean, PowerCache
+from tiles import TiledOcean
+from engine import SwarmEngine
+from spatial import SpatialIndex
+from direction import GPCache
+from collector import SwarmCollector
+
+
+def make_ocean(width=100, height=100, seed=10, update_every=1, interpolate=False, lazy=False,
+               dtype="float64", memmap=None, tiled=False, scenario=None):
+    """Build the ocean described by the ``ocean_*`` arguments of ``SwarmModel``, already initialized."""
+    if not tiled:
+        ocean = Ocean(
+            width=width,
+            height=height,
+            max_power = 1,
+            seed=seed,
+            update_every=update_every,
+            interpolate=interpolate,
+            lazy=lazy,
+            dtype=dtype,
+            memmap=memmap,
+            scenario=scenario,
         )
-
-        self.power = Ocean(width=width, height=height, max_power = 1, seed=seed)
-        self.power.modify_ocean()
-
-        
-        #{"connections": lambda m: sum(len(a.neighbors) for a in m.agents),}
-        #print(self.datacollector.agent_reporters)
-        #agent_reporters={"battery": lambda a: a.battery},
-
-        # Create and place the Boid agents
-        positions = self.rng.random(size=(population_size, 2)) * self.space.size
-        directions = self.rng.uniform(-1, 1, size=(population_size, 2))
-        WEC.create_agents(
-            self,
-            population_size,
-            self.space,
-            position=positions,
-            max_speed=speed,
-            speed = 0,
-            direction=directions,
-            separation=separation,
-            vision=vision,
-            consume=consume,
-            efficiency=efficiency,
-            battery=battery,
-            load = load,
+    else:
+        ocean = TiledOcean(
+            width=width,
+            height=height,
+            max_power=1,
+            seed=seed,
+            update_every=update_every,
+            dtype=dtype,
         )
-
-        model_reporter = {
-            "mean_energy_harvested": lambda m: np.mean([a.energy_harvested for a in m.agents]),
-            "net_energy_harvested": lambda m: np.mean([a.energy_harvested for a in m.agents]) - np.mean([a.consume for a in m.agents]),
-            "total_energy_harvested": lambda m: np.sum([a.total_energy_harvested for a in m.agents]),
-         #   "count_agent_in_zone"= count_agent_in_zone ,
-            "avg_battery": lambda m: np.mean([a.battery for a in m.agents]),
-            "connections": lambda m: np.sum([len(a.neighbors) for a in m.agents]),
-            "total_load": lambda m: np.multiply(np.divide(np.sum([a.load for a in m.agents]), population_size), 100)
-        }
-
-        agent_reporter = {
-            "mean_energy_harvested": lambda a: a.energy_harvested,
-            "net_energy_harvested": lambda a : a.energy_harvested,
-            "total_energy_harvested": lambda a: a.total_energy_harvested,
-      #      "count_agent_in_zone": lambda a : a.count_agent_in_zone,
-            "battery": lambda a: a.battery,
-            "WEC_power": lambda a: a.WEC_power
-        }
-
-
-        self.datacollector = DataCollector(model_reporters=model_reporter, agent_reporters=agent_reporter)
-
-        # For tracking statistics
-        self.average_heading = None
-        self.update_average_heading()
-        #self.datacollector.collect(self)
-        self.count = 0
+    ocean.modify_ocean()
+    return ocean
 
 
-    # vectorizing the calculation of angles for all agents
-    def calculate_angles(self):
-        d1 = np.array([agent.direction[0] for agent in self.agents])
-        d2 = np.array([agent.direction[1] for agent in self.agents])
-        self.agent_angles = np.degrees(np.arctan2(d1, d2))
-        for agent, angle in zip(self.agents, self.agent_angles):
-            agent.angle = angle
+class SwarmModel(Model):
+    """Flocker model class. Handles agent creation, placement and scheduling.
 
-    def update_average_heading(self):
-        """Calculate the average heading (direction) of all Boids."""
-        if not self.agents:
-            self.average_heading = 0
-            return
+    A step runs the phases
+        1. agents: sense → battery → separation → steer → move, agent by agent
+           in random order, or for the whole swarm at once by the ``SwarmEngine``
+        2. statistics: average heading and angles
+        3. collect: the metrics of the step
+        4. ocean: the power field evolves, unless the ocean is shared and
+           advanced by its owner (``compare.Comparison``)
+    """
 
-        headings = np.array([agent.direction for agent in self.agents])
-        mean_heading = np.mean(headings, axis=0)
-        self.average_heading = np.arctan2(mean_heading[1], mean_heading[0])
-
-    def step(self):
-        """Run one step of the model.
-        All agents are activated in random order using the AgentSet shuffle_do method.
-        """
-        self.agents.shuffle_do("step")
-        self.update_average_heading()
-        self.calculate_angles()
-        self.datacollector.collect(self)
-        #self.count += 1
-        #if self.count == 300:
-        #    self.power.modify_ocean()
-        #    self.count = 0
-        self.power.update()
-
-
-
-
-class WECSTATIC(Model):
-    """Flocker model class. Handles agent creation, placement and scheduling."""
+    agent_class = WEC
 
     def __init__(
         self,
@@ -172,6 +85,21 @@ class WECSTATIC(Model):
         battery=30,
         load = 0,
         seed=10,
+        ocean_update_every=1,
+        ocean_interpolate=False,
+        ocean_lazy=False,
+        ocean_dtype="float64",
+        ocean_memmap=None,
+        ocean_tiled=False,
+        ocean_scenario=None,
+        collect_every=1,
+        collect_window=None,
+        collect_sink=None,
+        collect_flush_every=100,
+        vectorized=False,
+        gp_cache_size=None,
+        gp_tolerance=0.1,
+        ocean=None,
     ):
         """Create a new Boids Flocking model.
 
@@ -186,7 +114,36 @@ class WECSTATIC(Model):
             separate: Weight of separation behavior (default: 0.015)
             match: Weight of alignment behavior (default: 0.05)
             seed: Random seed for reproducibility (default: None)
+            ocean_update_every: The ocean evolves once every this many steps (default: 1)
+            ocean_interpolate: Blend linearly between ocean keyframes in between updates (default: False)
+            ocean_lazy: Recompute the ocean only when it is sampled, applying the skipped
+                evolutions one by one (default: False); the agents sample it at every step,
+                so this only saves work on an ocean that is not read at every update
+            ocean_dtype: dtype of the ocean fields, "float32" halves their memory (default: "float64")
+            ocean_memmap: Directory where this model keeps the ocean fields as memory-mapped
+                files, for domains larger than the RAM (default: None, in memory)
+            ocean_tiled: Generate the ocean only in tiles around the agents (TiledOcean), for
+                very large domains; ocean_interpolate, ocean_lazy and ocean_memmap apply to
+                the whole-grid ocean only (default: False)
+            ocean_scenario: Directory of a pre-rendered scenario (scenario.py) to replay
+                instead of simulating the ocean (default: None)
+            collect_every: Collect the metrics once every this many steps (default: 1)
+            collect_window: Keep only the metrics of the last this many collections (default: None, all)
+            collect_sink: ParquetSink or HDF5Sink the metrics are streamed to (default: None)
+            collect_flush_every: Collections buffered before writing them to the sink (default: 100)
+            vectorized: Step the whole swarm with the array based SwarmEngine
+                instead of activating the agents one by one (default: False)
+            gp_cache_size: Maximum number of per-agent GP factorizations kept between steps; agents
+                are activated in random order, so a smaller cache misses most lookups
+                (default: None, one per agent)
+            gp_tolerance: A neighbor that moved less than this keeps its place in the
+                cached factorization, only its power is refreshed (default: 0.1)
+            ocean: An existing Ocean or TiledOcean of size width x height to share with
+                other models; the ocean_* arguments are then ignored and the ocean is
+                not advanced by ``step`` (default: None, the model builds its own)
         """
+        # constructor arguments, to rebuild the model from a checkpoint
+        self.params = {name: value for name, value in locals().items() if name not in ("self", "__class__")}
         super().__init__(seed=seed)
         self.rng = default_rng(seed=seed)                #To make the initial positioning of the agents in the Static and Dynamic environment simillar we add this
 
@@ -200,18 +157,44 @@ class WECSTATIC(Model):
             n_agents=population_size,
         )
 
-        self.power = Ocean(width=width, height=height, max_power = 1, seed=seed)
-        self.power.modify_ocean()
+        self.shared_ocean = ocean is not None
+        if self.shared_ocean:
+            if (ocean.width, ocean.height) != (width, height):
+                raise ValueError(f"the shared ocean is {ocean.width} x {ocean.height}, the model {width} x {height}")
+            self.power = ocean
+        else:
+            self.power = make_ocean(
+                width=width,
+                height=height,
+                seed=seed,
+                update_every=ocean_update_every,
+                interpolate=ocean_interpolate,
+                lazy=ocean_lazy,
+                dtype=ocean_dtype,
+                memmap=ocean_memmap,
+                tiled=ocean_tiled,
+                scenario=ocean_scenario,
+            )
+        self.power_cache = PowerCache(self.power, self.space)
+        self.spatial_index = SpatialIndex(self.space)
+        if gp_cache_size is None:
+            gp_cache_size = population_size
+        self.gp_cache = GPCache(maxsize=gp_cache_size, tolerance=gp_tolerance)
 
         
         #{"connections": lambda m: sum(len(a.neighbors) for a in m.agents),}
         #print(self.datacollector.agent_reporters)
         #agent_reporters={"battery": lambda a: a.battery},
 
+        # state, directions and headings of the agents, one row per row of the space;
+        # the agents read and write their own row (SwarmAgent.battery, .direction, .angle, ...)
+        self.agent_arrays = AgentArrays(population_size)
+        self.engine = None
+
         # Create and place the Boid agents
         positions = self.rng.random(size=(population_size, 2)) * self.space.size
         directions = self.rng.uniform(-1, 1, size=(population_size, 2))
-        STATIC.create_agents(
+        self.agent_class.create_agents(
             self,
             population_size,
             self.space,
@@ -226,28 +209,15 @@ class WECSTATIC(Model):
             battery=battery,
             load = load,
         )
-
-        model_reporter = {
-            "mean_energy_harvested": lambda m: np.mean([a.energy_harvested for a in m.agents]),
-            "net_energy_harvested": lambda m: np.mean([a.energy_harvested for a in m.agents]) - np.mean([a.consume for a in m.agents]),
-            "total_energy_harvested": lambda m: np.sum([a.total_energy_harvested for a in m.agents]),
-         #   "count_agent_in_zone"= count_agent_in_zone ,
-            "avg_battery": lambda m: np.mean([a.battery for a in m.agents]),
-            "connections": lambda m: np.sum([len(a.neighbors) for a in m.agents]),
-            "total_load": lambda m: np.multiply(np.divide(np.sum([a.load for a in m.agents]), population_size), 100)
-        }
-
-        agent_reporter = {
-            "mean_energy_harvested": lambda a: a.energy_harvested,
-            "net_energy_harvested": lambda a : a.energy_harvested,
-            "total_energy_harvested": lambda a: a.total_energy_harvested,
-      #      "count_agent_in_zone": lambda a : a.count_agent_in_zone,
-            "battery": lambda a: a.battery,
-            "WEC_power": lambda a: a.WEC_power
-        }
-
-
-        self.datacollector = DataCollector(model_reporters=model_reporter, agent_reporters=agent_reporter)
+        if vectorized:
+            self.engine = SwarmEngine(self)
+
+        self.datacollector = SwarmCollector(
+            interval=collect_every,
+            window=collect_window,
+            sink=collect_sink,
+            flush_every=collect_flush_every,
+        )
 
         # For tracking statistics
         self.average_heading = None
@@ -256,13 +226,35 @@ class WECSTATIC(Model):
         self.count = 0
 
 
-    # vectorizing the calculation of angles for all agents
+    def close(self):
+        """Release what the model keeps outside of memory, at the end of a run.
+
+        The collector sink is flushed and closed and the files of the ocean are
+        deleted (``ocean_memmap``); a shared ocean is left to whoever built it.
+        """
+        self.datacollector.close()
+        if not self.shared_ocean:
+            self.power.close()
+
+    @property
+    def directions(self):
+        """Direction of movement of every agent, one row per row of the space."""
+        return self.agent_arrays.directions
+
+    @property
+    def agent_angles(self):
+        """Heading of every agent in degrees, one per row of the space."""
+        return self.agent_arrays.angles
+
+    def agents_changed(self):
+        """Agents were added or removed: the engine is rebuilt on the new arrays."""
+        if self.engine is not None:
+            self.engine = SwarmEngine(self)
+
+    # angles of all agents at once, in place in agent_angles (read by agent.angle)
     def calculate_angles(self):
-        d1 = np.array([agent.direction[0] for agent in self.agents])
-        d2 = np.array([agent.direction[1] for agent in self.agents])
-        self.agent_angles = np.degrees(np.arctan2(d1, d2))
-        for agent, angle in zip(self.agents, self.agent_angles):
-            agent.angle = angle
+        np.arctan2(self.directions[:, 0], self.directions[:, 1], out=self.agent_angles)
+        np.degrees(self.agent_angles, out=self.agent_angles)
 
     def update_average_heading(self):
         """Calculate the average heading (direction) of all Boids."""
@@ -270,152 +262,61 @@ class WECSTATIC(Model):
             self.average_heading = 0
             return
 
-        headings = np.array([agent.direction for agent in self.agents])
-        mean_heading = np.mean(headings, axis=0)
+        mean_heading = np.mean(self.directions, axis=0)
         self.average_heading = np.arctan2(mean_heading[1], mean_heading[0])
 
+    def max_displacement(self):
+        """Upper bound on the distance an agent can move in one step."""
+        norms = np.linalg.norm(self.directions, axis=1)
+        return float(np.max(self.agent_arrays.max_speed * np.maximum(norms, 1.0), initial=0.0))
+
     def step(self):
-        """Run one step of the model.
-        All agents are activated in random order using the AgentSet shuffle_do method.
-        """
-        self.agents.shuffle_do("step")
-        self.update_average_heading()
-        self.calculate_angles()
+        """Run one step of the model."""
+        self.step_agents()
+        self.update_statistics()
         self.datacollector.collect(self)
         #self.count += 1
         #if self.count == 300:
         #    self.power.modify_ocean()
         #    self.count = 0
-        self.power.update()
-
-class WECgp(Model):
-    """Flocker model class. Handles agent creation, placement and scheduling."""
+        if not self.shared_ocean:
+            self.power.update()
 
-    def __init__(
-        self,
-        population_size=100,
-        width=100,
-        height=100,
-        speed=1,
-        vision=20,
-        separation=5,
-        efficiency=0.6,
-        consume=1,
-        battery=30,
-        load = 0,
-        seed=10,
-    ):
-        """Create a new Boids Flocking model.
+    def step_agents(self):
+        """Sense, battery, separation, steer and move phases of every agent.
 
-        Args:
-            population_size: Number of Boids in the simulation (default: 100)
-            width: Width of the space (default: 100)
-            height: Height of the space (default: 100)
-            speed: How fast the Boids move (default: 1)
-            vision: How far each Boid can see (default: 10)
-            separation: Minimum distance between Boids (default: 2)
-            cohere: Weight of cohesion behavior (default: 0.03)
-            separate: Weight of separation behavior (default: 0.015)
-            match: Weight of alignment behavior (default: 0.05)
-            seed: Random seed for reproducibility (default: None)
+        Without the engine the agents are activated in random order using the
+        AgentSet shuffle_do method.
         """
-        super().__init__(seed=seed)
-        self.rng = default_rng(seed=seed)                #To make the initial positioning of the agents in the Static and Dynamic environment simillar we add this
-
-        self.cumulative_load = 0.0
-
-        # Set up the space
-        self.space = ContinuousSpace(
-            [[0, width], [0, height]],
-            torus=False,
-            random=self.random,
-            n_agents=population_size,
-        )
-
-        self.power = Ocean(width=width, height=height, max_power = 1, seed=seed)
-        self.power.modify_ocean()
-
-        
-        #{"connections": lambda m: sum(len(a.neighbors) for a in m.agents),}
-        #print(self.datacollector.agent_reporters)
-        #agent_reporters={"battery": lambda a: a.battery},
+        if self.engine is not None:
+            self.engine.step()
+            self.engine.sync_agents()
+            return
+        if self.agent_class.policy.mobile:
+            self.spatial_index.rebuild(margin=self.max_displacement())
+        self.agents.shuffle_do("step")
 
-        # Create and place the Boid agents
-        positions = self.rng.random(size=(population_size, 2)) * self.space.size
-        directions = self.rng.uniform(-1, 1, size=(population_size, 2))
-        GP.create_agents(
-            self,
-            population_size,
-            self.space,
-            position=positions,
-            max_speed=speed,
-            speed = 0,
-            direction=directions,
-            separation=separation,
-            vision=vision,
-            consume=consume,
-            efficiency=efficiency,
-            battery=battery,
-            load = load,
-        )
+    def update_statistics(self):
+        self.update_average_heading()
+        self.calculate_angles()
 
-        model_reporter = {
-            "mean_energy_harvested": lambda m: np.mean([a.energy_harvested for a in m.agents]),
-            "net_energy_harvested": lambda m: np.mean([a.energy_harvested for a in m.agents]) - np.mean([a.consume for a in m.agents]),
-            "total_energy_harvested": lambda m: np.sum([a.total_energy_harvested for a in m.agents]),
-         #   "count_agent_in_zone"= count_agent_in_zone ,
-            "avg_battery": lambda m: np.mean([a.battery for a in m.agents]),
-            "connections": lambda m: np.sum([len(a.neighbors) for a in m.agents]),
-            "total_load": lambda m: np.multiply(np.divide(np.sum([a.load for a in m.agents]), population_size), 100)
-        }
 
-        agent_reporter = {
-            "mean_energy_harvested": lambda a: a.energy_harvested,
-            "net_energy_harvested": lambda a : a.energy_harvested,
-            "total_energy_harvested": lambda a: a.total_energy_harvested,
-      #      "count_agent_in_zone": lambda a : a.count_agent_in_zone,
-            "battery": lambda a: a.battery,
-            "WEC_power": lambda a: a.WEC_power
-        }
+class WECswarm(SwarmModel):
+    """Swarm of WECs heading to the neighbor with the highest power."""
 
+    agent_class = WEC
 
-        self.datacollector = DataCollector(model_reporters=model_reporter, agent_reporters=agent_reporter)
 
-        # For tracking statistics
-        self.average_heading = None
-        self.update_average_heading()
-        #self.datacollector.collect(self)
-        self.count = 0
+class WECSTATIC(SwarmModel):
+    """Moored WECs, the reference the swarms are compared with."""
 
+    agent_class = STATIC
 
-    # vectorizing the calculation of angles for all agents
-    def calculate_angles(self):
-        d1 = np.array([agent.direction[0] for agent in self.agents])
-        d2 = np.array([agent.direction[1] for agent in self.agents])
-        self.agent_angles = np.degrees(np.arctan2(d1, d2))
-        for agent, angle in zip(self.agents, self.agent_angles):
-            agent.angle = angle
 
-    def update_average_heading(self):
-        """Calculate the average heading (direction) of all Boids."""
-        if not self.agents:
-            self.average_heading = 0
-            return
+class WECgp(SwarmModel):
+    """Swarm of WECs heading to the maximum of a GP surrogate of the neighbors' power.
 
-        headings = np.array([agent.direction for agent in self.agents])
-        mean_heading = np.mean(headings, axis=0)
-        self.average_heading = np.arctan2(mean_heading[1], mean_heading[0])
+    With ``vectorized`` the GP directions are computed in batches.
+    """
 
-    def step(self):
-        """Run one step of the model.
-        All agents are activated in random order using the AgentSet shuffle_do method.
-        """
-        self.agents.shuffle_do("step")
-        self.update_average_heading()
-        self.calculate_angles()
-        self.datacollector.collect(self)
-        #self.count += 1
-        #if self.count == 300:
-        #    self.power.modify_ocean()
-        #    self.count = 0
-        self.power.update()
\ No newline at end of file
+    agent_class = GP
@@ -0,0 +1,200 @@
+"""Headless batch runner.
+
+Sweeps a parameter grid over the WEC models without the browser, one model
+per process of a ``ProcessPoolExecutor``. Each run writes its collected
+tables to the output directory, as CSV when it finishes or streamed to
+Parquet/HDF5 while it runs, and is recorded in ``runs.jsonl``; running the
+same sweep again skips the runs already recorded. With ``--checkpoint-every``
+an interrupted run restarts from its last checkpoint instead of from step 0.
+
+Example:
+    python runner.py --models WECswarm WECSTATIC --steps 500 \\
+        --set population_size=50,100 --set seed=1,2,3 --out results
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from model import WECswarm, WECgp, WECSTATIC
+from sink import ParquetSink, HDF5Sink
+from checkpoint import save_checkpoint, load_checkpoint
+
+MODELS = {
+    "WECswarm": WECswarm,
+    "WECgp": WECgp,
+    "WECSTATIC": WECSTATIC,
+}
+
+MANIFEST = "runs.jsonl"
+
+
+def parse_value(text):
+    """Parse a command line value as JSON (numbers, booleans), else keep the string."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def parse_assignment(text):
+    """Parse ``name=v1,v2,...`` into ``(name, [v1, v2, ...])``."""
+    name, _, values = text.partition("=")
+    if not name or not values:
+        raise argparse.ArgumentTypeError(f"expected name=value[,value...], got {text!r}")
+    return name, [parse_value(v) for v in values.split(",")]
+
+
+def expand_grid(models, grid, base_seed=0):
+    """Return one (model name, params) run for every point of the grid.
+
+    When ``seed`` is not part of the grid each point gets its own seed, derived
+    from ``base_seed`` and the position of the point in the grid. Every model
+    runs a point with the same seed, hence on the same initial ocean.
+    """
+    grid = {name: values if isinstance(values, list) else [values] for name, values in grid.items()}
+    names = sorted(grid)
+    points = []
+    for index, values in enumerate(itertools.product(*(grid[name] for name in names))):
+        params = dict(zip(names, values))
+        if "seed" not in params:
+            sequence = np.random.SeedSequence([base_seed, index])
+            params["seed"] = int(sequence.generate_state(1)[0])
+        points.append(params)
+    return [(model_name, dict(params)) for model_name in models for params in points]
+
+
+def run_id(model_name, params, steps):
+    """Stable identifier of a run, used as file name and to resume a sweep."""
+    key = json.dumps([model_name, params, steps], sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def completed_runs(out):
+    """Identifiers of the runs already recorded in the manifest of ``out``."""
+    path = os.path.join(out, MANIFEST)
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if line:
+                done.add(json.loads(line)["run_id"])
+    return done
+
+
+def execute(model_name, params, steps, out, identifier, output_format="csv", checkpoint_every=None):
+    """Run one model for ``steps`` steps and write its collected data (worker process)."""
+    if output_format == "parquet":
+        path = os.path.join(out, f"{identifier}_metrics")
+        params = {**params, "collect_sink": ParquetSink(path)}
+    elif output_format == "hdf5":
+        path = os.path.join(out, f"{identifier}.h5")
+        params = {**params, "collect_sink": HDF5Sink(path)}
+
+    checkpoint = os.path.join(out, f"{identifier}.ckpt")
+    if checkpoint_every and os.path.exists(checkpoint):
+        model = load_checkpoint(checkpoint)
+    else:
+        model = MODELS[model_name](**params)
+    while model.steps < steps:
+        model.step()
+        if checkpoint_every and model.steps % checkpoint_every == 0 and model.steps < steps:
+            save_checkpoint(model, checkpoint)
+
+    if output_format != "csv":
+        model.close()
+        return {"metrics": os.path.basename(path)}
+
+    files = {}
+    tables = {
+        "model": model.datacollector.get_model_vars_dataframe(),
+        "agents": model.datacollector.get_agent_vars_dataframe(),
+    }
+    for kind, table in tables.items():
+        path = os.path.join(out, f"{identifier}_{kind}.csv")
+        table.to_csv(path + ".tmp")
+        os.replace(path + ".tmp", path)  # a crash never leaves a half written table behind
+        files[kind] = os.path.basename(path)
+    model.close()
+    shutil.rmtree(checkpoint, ignore_errors=True)
+    return files
+
+
+def sweep(models, grid, steps, out, workers=None, base_seed=0, output_format="csv", checkpoint_every=None):
+    """Run every point of the grid not yet completed in ``out``.
+
+    Returns the number of runs executed by this call.
+    """
+    os.makedirs(out, exist_ok=True)
+    done = completed_runs(out)
+    pending = []
+    for model_name, params in expand_grid(models, grid, base_seed=base_seed):
+        identifier = run_id(model_name, params, steps)
+        if identifier not in done:
+            pending.append((model_name, params, identifier))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(os.path.join(out, MANIFEST), "a") as manifest:
+        futures = {
+            pool.submit(execute, model_name, params, steps, out, identifier, output_format, checkpoint_every): (
+                model_name, params, identifier
+            )
+            for model_name, params, identifier in pending
+        }
+        for future in as_completed(futures):
+            model_name, params, identifier = futures[future]
+            files = future.result()
+            record = {"run_id": identifier, "model": model_name, "params": params, "steps": steps, "files": files}
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+            print(f"{model_name} {params} -> {identifier}")
+    return len(pending)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless parameter sweeps of the WEC models.")
+    parser.add_argument("--models", nargs="+", default=["WECswarm"], choices=sorted(MODELS))
+    parser.add_argument("--steps", type=int, default=100, help="steps per run")
+    parser.add_argument("--grid", help="JSON file mapping parameter names to lists of values")
+    parser.add_argument(
+        "--set", dest="assignments", action="append", type=parse_assignment, default=[],
+        metavar="NAME=V1,V2", help="values of one parameter (repeatable, overrides --grid)",
+    )
+    parser.add_argument("--out", default="results", help="output directory")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--seed", type=int, default=0, help="base seed when seed is not swept")
+    parser.add_argument(
+        "--format", dest="output_format", default="csv", choices=["csv", "parquet", "hdf5"],
+        help="csv tables at the end of each run, or metrics streamed to Parquet/HDF5 while it runs",
+    )
+    parser.add_argument(
+        "--checkpoint-every", type=int, default=None, metavar="STEPS",
+        help="checkpoint each run every this many steps and resume interrupted runs (csv only)",
+    )
+    args = parser.parse_args(argv)
+    if args.checkpoint_every and args.output_format != "csv":
+        parser.error("--checkpoint-every needs --format csv: streamed files cannot be resumed")
+
+    grid = {}
+    if args.grid:
+        with open(args.grid) as grid_file:
+            grid.update(json.load(grid_file))
+    grid.update(dict(args.assignments))
+
+    executed = sweep(
+        args.models, grid, args.steps, args.out,
+        workers=args.workers, base_seed=args.seed, output_format=args.output_format,
+        checkpoint_every=args.checkpoint_every,
+    )
+    print(f"{executed} runs executed, results in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Pre-rendered ocean scenarios.
+
+A scenario is one sea state computed once and replayed by any number of
+models: the field after each evolution of an ``Ocean`` (frame 0 is the
+initial field of ``modify_ocean``), stored in chunks of frames along time.
+An ``Ocean`` created with ``scenario=path`` reads its frames instead of
+simulating them, following its own ``update_every``/``interpolate`` schedule,
+so with the same seed and schedule the replay is identical to the live ocean.
+
+Layout of the scenario directory:
+
+- ``scenario.json``: format version, shape, dtype, seed, frames, chunking
+- ``chunk_00000.npy`` ... : uncompressed chunks, read memory-mapped (shared
+  through the page cache by the processes of a sweep)
+- or ``chunk_00000.npz`` ... : zlib compressed chunks, one chunk decompressed
+  at a time
+
+Example:
+    python scenario.py --evolutions 1000 --width 100 --height 100 --seed 10 --out sea
+    python runner.py --models WECswarm WECgp WECSTATIC --steps 1000 --set ocean_scenario=sea --set seed=10
+"""
+
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+FORMAT = "wec-scenario"
+VERSION = 1
+
+
+def record_scenario(path, evolutions, width=100, height=100, max_power=1, seed=10, dtype="float64",
+                    chunk_frames=16, compress=True):
+    """Simulate ``evolutions`` evolutions of an ocean and store them as a scenario.
+
+    Args:
+        path: Scenario directory, replaced if it exists
+        evolutions: Evolutions to record; a run of S steps with update_every u needs S // u
+            of them, one more with interpolate
+        width, height, max_power, seed: As for ``Ocean``
+        dtype: dtype of the stored frames (default: "float64")
+        chunk_frames: Frames per chunk (default: 16)
+        compress: Compress the chunks; uncompressed chunks are memory-mapped on replay (default: True)
+    """
+    from environment import Ocean
+
+    ocean = Ocean(width=width, height=height, max_power=max_power, seed=seed, dtype=dtype)
+    ocean.modify_ocean()
+
+    tmp = path.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    chunk = np.empty((chunk_frames, width, height), dtype=ocean.dtype)
+    for frame in range(evolutions + 1):
+        if frame:
+            ocean.evolve(ocean.data, out=ocean.data)
+        chunk[frame % chunk_frames] = ocean.data
+        if frame % chunk_frames == chunk_frames - 1 or frame == evolutions:
+            name = os.path.join(tmp, f"chunk_{frame // chunk_frames:05d}")
+            frames = chunk[: frame % chunk_frames + 1]
+            if compress:
+                np.savez_compressed(name + ".npz", frames=frames)
+            else:
+                np.save(name + ".npy", frames)
+
+    meta = {
+        "format": FORMAT,
+        "version": VERSION,
+        "width": width,
+        "height": height,
+        "max_power": max_power,
+        "seed": seed,
+        "dtype": str(ocean.dtype),
+        "frames": evolutions + 1,
+        "chunk_frames": chunk_frames,
+        "compress": compress,
+    }
+    with open(os.path.join(tmp, "scenario.json"), "w") as file:
+        json.dump(meta, file, indent=1)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+
+class Scenario:
+    """Reader of a scenario directory, keeping one chunk open at a time."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "scenario.json")) as file:
+            self.meta = json.load(file)
+        if self.meta.get("format") != FORMAT:
+            raise ValueError(f"{path} is not an ocean scenario")
+        if self.meta["version"] > VERSION:
+            raise ValueError(f"scenario version {self.meta['version']} is newer than the supported {VERSION}")
+        self.shape = (self.meta["width"], self.meta["height"])
+        self.chunk_frames = self.meta["chunk_frames"]
+        self.index = None
+        self.chunk = None
+
+    def __len__(self):
+        return self.meta["frames"]
+
+    def load(self, index):
+        name = os.path.join(self.path, f"chunk_{index:05d}")
+        if self.meta["compress"]:
+            with np.load(name + ".npz") as archive:
+                self.chunk = archive["frames"]
+        else:
+            self.chunk = np.load(name + ".npy", mmap_mode="r")
+        self.index = index
+
+    def read(self, frame, out):
+        """Copy frame ``frame`` into ``out`` and return it."""
+        if not 0 <= frame < len(self):
+            raise ValueError(f"frame {frame} is outside the scenario {self.path} ({len(self)} frames)")
+        index = frame // self.chunk_frames
+        if index != self.index:
+            self.load(index)
+        np.copyto(out, self.chunk[frame % self.chunk_frames])
+        return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render the evolution of an ocean.")
+    parser.add_argument("--evolutions", type=int, required=True, help="evolutions to record")
+    parser.add_argument("--width", type=int, default=100)
+    parser.add_argument("--height", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=10)
+    parser.add_argument("--dtype", default="float64", choices=["float64", "float32"])
+    parser.add_argument("--chunk-frames", type=int, default=16)
+    parser.add_argument("--no-compress", dest="compress", action="store_false",
+                        help="store uncompressed chunks, memory-mapped on replay")
+    parser.add_argument("--out", required=True, help="scenario directory")
+    args = parser.parse_args(argv)
+    record_scenario(
+        args.out, args.evolutions, width=args.width, height=args.height, seed=args.seed,
+        dtype=args.dtype, chunk_frames=args.chunk_frames, compress=args.compress,
+    )
+    print(f"{args.evolutions + 1} frames written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,20 @@
 import numpy as np
-from scipy import stats
+from scipy.special import ndtr
+
+
+def probability_below(value, mu, std):
+    """
+    P(X <= value) for X ~ N(mu, std), element-wise.
+
+    With std == 0 (all the data equal, or a single sample) the normal collapses on mu:
+    the probability is 1 if value >= mu, else 0.
+    """
+    value, mu, std = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (value, mu, std)))
+    degenerate = std == 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        prob = ndtr((value - mu) / std)
+    return np.where(degenerate, (value >= mu).astype(float), prob)
+
 
 def estimate_probability(data, lower=None, upper=None):
     """
@@ -9,31 +24,59 @@ def estimate_probability(data, lower=None, upper=None):
     - data (list or np.array): The dataset
     - lower (float): Lower bound of the interval (None means -∞)
     - upper (float): Upper bound of the interval (None means +∞)
-    - use_kde (bool): Use KDE instead of normal distribution
 
     Returns:
     - prob (float): Estimated probability
     """
 
-    data = np.array(data)
+    data = np.asarray(data, dtype=float)
 
     # Set bounds
     if lower is None:
         lower = -np.inf
     if upper is None:
         upper = np.inf
-    
-    mu, std = stats.norm.fit(data)
-    prob = np.multiply(stats.norm.cdf(upper, mu, std) - stats.norm.cdf(lower, mu, std), 1)
-    #print(prob)
 
-    return prob
+    # maximum likelihood normal fit, like stats.norm.fit
+    mu = data.mean()
+    std = data.std()
+    prob = probability_below(upper, mu, std) - probability_below(lower, mu, std)
+
+    return float(prob)
+
 
 def separation(s_min, agent_power, neighbours_power):
-    #print(neighbours_power)
+    if len(neighbours_power) == 0:
+        return s_min
     s = np.multiply(s_min, 2.25 - np.multiply(estimate_probability(data=neighbours_power, upper=agent_power), 1.25))
     if s < s_min:
         s = s_min
+    return s
+
+
+def separation_many(s_min, agent_power, neighbours_power, counts):
+    """
+    Adaptive separation of a whole swarm at once.
+
+    Parameters:
+    - s_min (float or np.array): Minimum separation, scalar or one per agent
+    - agent_power (np.array): Power at each of the N agents
+    - neighbours_power (np.array): Power of the neighbours of agent 0, then of agent 1, ...
+    - counts (np.array): Number of neighbours of each agent
+
+    Agents without neighbours get s_min, like separation.
+    """
+    agent_power = np.asarray(agent_power, dtype=float)
+    neighbours_power = np.asarray(neighbours_power, dtype=float)
+    counts = np.asarray(counts)
+    n = len(counts)
+    owner = np.repeat(np.arange(n), counts)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mu = np.bincount(owner, weights=neighbours_power, minlength=n) / counts
+        var = np.bincount(owner, weights=(neighbours_power - mu[owner]) ** 2, minlength=n) / counts
+    prob = probability_below(agent_power, mu, np.sqrt(var))
 
-    print(s)
-    return s
\ No newline at end of file
+    s_min = np.broadcast_to(np.asarray(s_min, dtype=float), (n,))
+    s = np.maximum(s_min * (2.25 - prob * 1.25), s_min)
+    return np.where(counts == 0, s_min, s)
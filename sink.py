@@ -0,0 +1,181 @@
+"""Streaming sinks for the swarm metrics.
+
+A ``SwarmCollector`` with a sink keeps only a fixed window of collections in
+memory and appends the rest to disk every ``flush_every`` collections, so the
+memory of a run no longer grows with agents x steps. Two formats are
+available, both optional dependencies imported only when used:
+
+- ``ParquetSink``: one Parquet file per table, one compressed row group per flush (pyarrow)
+- ``HDF5Sink``: chunked, compressed, resizable datasets (h5py)
+
+``read_metrics`` loads a step range and/or a subset of agents without
+reading the whole file.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class ParquetSink:
+    """Append the metrics to ``<path>/model.parquet`` and ``<path>/agents.parquet``.
+
+    Args:
+        path: Output directory
+        compression: Parquet compression codec (default: "zstd")
+    """
+
+    def __init__(self, path, compression="zstd"):
+        import pyarrow  # noqa: F401 - fail early if the optional dependency is missing
+
+        self.path = path
+        self.compression = compression
+        self.writers = {}
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, steps, model_columns, agent_ids, agent_columns):
+        """Append one block of collections.
+
+        Args:
+            steps: (T,) steps of the collections
+            model_columns: metric -> (T,) values
+            agent_ids: (N,) agent ids
+            agent_columns: metric -> (T, N) values
+        """
+        import pyarrow as pa
+
+        self.append("model", pa.table({"Step": steps, **model_columns}))
+        n = len(agent_ids)
+        self.append("agents", pa.table({
+            "Step": np.repeat(steps, n),
+            "AgentID": np.tile(agent_ids, len(steps)),
+            **{name: np.ascontiguousarray(values).reshape(-1) for name, values in agent_columns.items()},
+        }))
+
+    def append(self, kind, table):
+        import pyarrow.parquet as pq
+
+        writer = self.writers.get(kind)
+        if writer is None:
+            path = os.path.join(self.path, f"{kind}.parquet")
+            writer = self.writers[kind] = pq.ParquetWriter(path, table.schema, compression=self.compression)
+        writer.write_table(table)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+    @staticmethod
+    def read(path, kind="model", start=None, stop=None, agent_ids=None, columns=None):
+        import pyarrow.parquet as pq
+
+        filters = []
+        if start is not None:
+            filters.append(("Step", ">=", start))
+        if stop is not None:
+            filters.append(("Step", "<", stop))
+        if agent_ids is not None and kind == "agents":
+            filters.append(("AgentID", "in", list(agent_ids)))
+        if columns is not None:
+            columns = ["Step"] + (["AgentID"] if kind == "agents" else []) + list(columns)
+        # row groups outside the step range are skipped using their statistics
+        table = pq.read_table(os.path.join(path, f"{kind}.parquet"), columns=columns, filters=filters or None)
+        index = ["Step", "AgentID"] if kind == "agents" else ["Step"]
+        return table.to_pandas().set_index(index)
+
+
+class HDF5Sink:
+    """Append the metrics to resizable, chunked datasets of an HDF5 file.
+
+    Layout: ``steps`` (T,), ``agent_ids`` (N,), ``model/<metric>`` (T,) and
+    ``agents/<metric>`` (T, N).
+
+    Args:
+        path: Output file
+        compression: HDF5 compression filter (default: "gzip")
+        chunk_steps: Collections per chunk along the step axis (default: 64)
+    """
+
+    def __init__(self, path, compression="gzip", chunk_steps=64):
+        import h5py
+
+        self.file = h5py.File(path, "w")
+        self.compression = compression
+        self.chunk_steps = chunk_steps
+
+    def dataset(self, name, shape, dtype):
+        if name not in self.file:
+            self.file.create_dataset(
+                name, shape=(0,) + shape, maxshape=(None,) + shape, dtype=dtype,
+                chunks=(self.chunk_steps,) + shape, compression=self.compression,
+            )
+        return self.file[name]
+
+    def extend(self, name, values):
+        values = np.asarray(values)
+        dataset = self.dataset(name, values.shape[1:], values.dtype)
+        end = dataset.shape[0]
+        dataset.resize(end + len(values), axis=0)
+        dataset[end:] = values
+
+    def write(self, steps, model_columns, agent_ids, agent_columns):
+        """Append one block of collections, same arguments as ``ParquetSink.write``."""
+        if "agent_ids" not in self.file:
+            self.file.create_dataset("agent_ids", data=np.asarray(agent_ids))
+            # h5py lists the members of a group alphabetically: keep the metric order
+            self.file.create_group("model").attrs["columns"] = list(model_columns)
+            self.file.create_group("agents").attrs["columns"] = list(agent_columns)
+        self.extend("steps", steps)
+        for name, values in model_columns.items():
+            self.extend(f"model/{name}", values)
+        for name, values in agent_columns.items():
+            self.extend(f"agents/{name}", values)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    @staticmethod
+    def read(path, kind="model", start=None, stop=None, agent_ids=None, columns=None):
+        import h5py
+
+        with h5py.File(path, "r") as file:
+            steps = file["steps"][:]
+            # steps are increasing: the range is one contiguous slice of rows
+            first = 0 if start is None else np.searchsorted(steps, start, side="left")
+            last = len(steps) if stop is None else np.searchsorted(steps, stop, side="left")
+            steps = steps[first:last]
+            group = file[kind]
+            names = list(group.attrs["columns"]) if columns is None else list(columns)
+            if kind == "model":
+                data = {name: group[name][first:last] for name in names}
+                return pd.DataFrame(data, index=pd.Index(steps, name="Step"))
+
+            ids = file["agent_ids"][:]
+            if agent_ids is None:
+                selection = slice(None)
+            else:
+                selection = np.sort(np.flatnonzero(np.isin(ids, agent_ids)))
+                ids = ids[selection]
+            data = {name: group[name][first:last, selection].reshape(-1) for name in names}
+            index = pd.MultiIndex.from_arrays(
+                [np.repeat(steps, len(ids)), np.tile(ids, len(steps))], names=["Step", "AgentID"]
+            )
+            return pd.DataFrame(data, index=index)
+
+
+def read_metrics(path, kind="model", start=None, stop=None, agent_ids=None, columns=None):
+    """Read metrics written by a sink.
+
+    Args:
+        path: Directory of a ParquetSink or file of an HDF5Sink (.h5/.hdf5)
+        kind: "model" or "agents"
+        start: First step to read (default: from the beginning)
+        stop: Step where to stop, excluded (default: to the end)
+        agent_ids: Only these agents, for kind="agents" (default: all)
+        columns: Only these metrics (default: all)
+    """
+    reader = HDF5Sink if os.path.splitext(path)[1] in (".h5", ".hdf5") else ParquetSink
+    return reader.read(path, kind=kind, start=start, stop=stop, agent_ids=agent_ids, columns=columns)
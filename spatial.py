@@ -0,0 +1,79 @@
+"""Spatial index for the neighbor queries of the swarm.
+
+A KD-tree over the agent positions is built once per step. It answers the
+vision query of every agent, together with the distances, so the crowd test
+does not need a second distance pass.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class SpatialIndex:
+    """KD-tree over ``space.agent_positions``, rebuilt once per model step.
+
+    Agents activated one after the other keep moving after the rebuild. The
+    tree is then used only to collect candidates within ``radius + margin``,
+    where ``margin`` bounds how far any agent can move before the next rebuild,
+    and the exact distances are computed on the current positions. The
+    neighbors returned are therefore the same as a full scan of the space.
+    """
+
+    def __init__(self, space):
+        self.space = space
+        self.margin = 0.0
+        self.tree = None
+
+    def rebuild(self, margin=0.0):
+        """Snapshot the current positions.
+
+        Args:
+            margin: Upper bound on the distance any agent moves before the next rebuild
+        """
+        self.tree = cKDTree(self.space.agent_positions)
+        self.margin = margin
+
+    def neighbor_rows(self, agent, radius):
+        """Return the rows of the space within ``radius`` of ``agent`` and their distances.
+
+        Rows are sorted, like the agents of
+        ``ContinuousSpaceAgent.get_neighbors_in_radius``, and ``agent`` is excluded.
+        """
+        positions = self.space.agent_positions
+        index = self.space._agent_to_index[agent]
+        point = positions[index]
+        candidates = np.asarray(self.tree.query_ball_point(point, radius + self.margin), dtype=np.intp)
+        candidates.sort()
+        candidates = candidates[candidates != index]
+
+        delta = positions[candidates] - point
+        distances = np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2)
+        inside = distances <= radius
+        return candidates[inside], distances[inside]
+
+    def neighbors(self, agent, radius):
+        """Return the agents within ``radius`` of ``agent`` and their distances, see ``neighbor_rows``."""
+        rows, distances = self.neighbor_rows(agent, radius)
+        agents = [self.space._index_to_agent[k] for k in rows]
+        return agents, distances
+
+    def pairs(self, radius):
+        """Return all the (i, j, distance) pairs with ``distance <= radius[i]``, i != j.
+
+        Works on the positions of the last rebuild, for all agents at once.
+        Pairs are sorted by ``i`` and then by ``j``.
+
+        Args:
+            radius: Scalar radius or one radius per agent
+        """
+        positions = self.tree.data
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), (len(positions),))
+        found = self.tree.query_pairs(r=float(np.max(radius, initial=0)), output_type="ndarray")
+        i = np.concatenate([found[:, 0], found[:, 1]])
+        j = np.concatenate([found[:, 1], found[:, 0]])
+        delta = positions[j] - positions[i]
+        d = np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2)
+        keep = d <= radius[i]
+        i, j, d = i[keep], j[keep], d[keep]
+        order = np.lexsort((j, i))
+        return i[order], j[order], d[order]
@@ -0,0 +1,342 @@
+"""Tiled ocean for very large domains.
+
+``Ocean`` stores and evolves the whole ``width x height`` grid at every step,
+although the agents only sample it at their positions. ``TiledOcean`` builds
+the field only where it is needed:
+
+- the state is a white noise ``w`` (one value per cell) evolving as an AR(1)
+  process, and the power is ``max_power * Phi(G * w / std)``: ``w`` smoothed
+  by the Gaussian ``G`` of width ``sigma``, mapped to [0, max_power] by the
+  normal CDF ``Phi`` (the smoothed noise has standard deviation ``std``)
+- the means of ``w`` over blocks of ``coarse x coarse`` cells are kept for the
+  whole domain. Far from the agents the ocean exists only at this resolution,
+  which is also what ``data`` shows
+- the fine detail around the block means is generated per tile of
+  ``tile x tile`` cells, only for the tiles that are sampled and their
+  neighbors. The fine detail of every evolution is drawn from the seed, the
+  tile and the evolution only: a tile that has not been used for a few steps
+  is brought to the current time by replaying the evolutions it missed. A
+  tile is dropped once it has forgotten its state, and built again from the
+  last ``memory`` evolutions when it is needed, instead of from the first
+  one. What a tile shows therefore depends on when it was first sampled, but
+  only through history of weight below ``FORGET``
+
+Each tile is smoothed together with a halo of ``4 sigma`` cells read from the
+neighboring tiles, the same support and boundary rule as ``gaussian_filter``:
+the field is the one the whole grid would give (up to rounding), without
+seams between tiles. The separable filter is applied as two small banded
+matrix products that compute only the cells of the tile.
+
+The min-max normalization of ``Ocean`` needs the whole grid; here the normal
+CDF keeps the values in [0, max_power] with a uniform distribution instead.
+"""
+
+import math
+
+import numpy as np
+from scipy.ndimage import gaussian_filter
+from scipy.special import ndtr
+
+TRUNCATE = 4.0      # like gaussian_filter: the kernel stops at TRUNCATE * sigma
+FORGET = 1e-3       # a tile whose correlation with its stored state is below this is dropped
+
+
+def gaussian_kernel(sigma, truncate=TRUNCATE):
+    """Normalized 1D Gaussian kernel, the one used by ``gaussian_filter``."""
+    radius = int(truncate * sigma + 0.5)
+    x = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * x ** 2 / sigma ** 2)
+    return kernel / kernel.sum()
+
+
+class TiledOcean:
+    """Wave power field generated tile by tile around the agents.
+
+    Exposes the sampling interface of ``Ocean`` (``get_power``,
+    ``get_power_many``, ``update``, ``refresh``, ``modify_ocean``, ``version``,
+    ``data``), so a model can use either.
+
+    Args:
+        width: Cells along the first axis of the field
+        height: Cells along the second axis of the field
+        max_power: Maximum power (default: 1)
+        seed: Seed of the field (default: 42)
+        sigma: Width of the Gaussian smoothing, in cells (default: 15)
+        tile: Side of a fine tile, in cells; at least the smoothing halo and a
+            multiple of ``coarse``. Small tiles keep the halo of a sampled tile
+            small (default: None, the smallest valid size)
+        coarse: Side of a coarse block, in cells (default: 8)
+        correlation: Correlation of the noise between two evolutions; 0.99 keeps
+            the memory of the sea state for about a hundred evolutions (default: 0.99)
+        update_every: The field evolves once every this many steps (default: 1)
+        dtype: dtype of the fine fields (default: float64)
+    """
+
+    def __init__(self, width=100, height=100, max_power=1, seed=42, sigma=15, tile=None, coarse=8,
+                 correlation=0.99, update_every=1, dtype=np.float64):
+        self.width = width
+        self.height = height
+        self.max_power = max_power
+        self.seed = seed
+        self.sigma = sigma
+        self.halo = int(TRUNCATE * sigma + 0.5)
+        if tile is None:
+            tile = -(-self.halo // coarse) * coarse
+        if tile % coarse:
+            raise ValueError(f"tile ({tile}) must be a multiple of coarse ({coarse})")
+        if tile < self.halo:
+            raise ValueError(f"tile ({tile}) must be at least the smoothing halo ({self.halo} cells)")
+        self.tile = tile
+        self.coarse = coarse
+        self.correlation = correlation
+        self.update_every = max(1, int(update_every))
+        self.dtype = np.dtype(dtype)
+        self.rng = np.random.default_rng(seed)
+
+        self.shape = (width, height)
+        self.tiles = tuple(-(-n // tile) for n in self.shape)
+        blocks = tuple(-(-n // coarse) for n in self.shape)
+        # cells of every coarse block, fewer on the last row and column
+        self.block_rows = np.minimum(coarse, width - coarse * np.arange(blocks[0]))
+        self.block_cols = np.minimum(coarse, height - coarse * np.arange(blocks[1]))
+        self.block_cells = np.outer(self.block_rows, self.block_cols)
+        self.kernel = gaussian_kernel(sigma)
+        self.smoothing = {}     # geometry -> smoothing matrix, shared by the tiles
+        # standard deviation of G * w for a unit white noise w
+        self.std = np.sum(self.kernel ** 2)
+        # evolutions after which a stored tile has forgotten its state
+        self.memory = math.ceil(math.log(FORGET) / math.log(correlation)) if 0 < correlation < 1 else 1
+
+        self.time = 0
+        self.evolutions = 0
+        self.version = 0
+        self.modify_ocean()
+
+    def stream(self, *key):
+        """Random generator dedicated to ``key``, the same in every run with this seed."""
+        return np.random.default_rng([self.seed, *key])
+
+    def modify_ocean(self):
+        """Draw the initial sea state from the seed and forget every tile."""
+        means = self.stream(0).standard_normal(self.block_cells.shape)
+        self.means = means / np.sqrt(self.block_cells)
+        self.residuals = {}     # tile -> (evolution, fine detail around the block means)
+        self.noises = {}        # tile -> w at the current evolution
+        self.fields = {}        # tile -> power at the current evolution
+        self.overview = None
+        self.version += 1
+
+    # --- time -------------------------------------------------------------------
+
+    def update(self):
+        """Advance by one model step; the block means evolve, the tiles when they are sampled."""
+        self.time += 1
+        if self.time % self.update_every:
+            return
+        self.evolutions += 1
+        rho = self.correlation
+        noise = self.rng.standard_normal(self.means.shape)
+        noise /= np.sqrt(self.block_cells)
+        self.means *= rho
+        self.means += math.sqrt(1 - rho ** 2) * noise
+
+        self.noises.clear()
+        self.fields.clear()
+        self.overview = None
+        self.version += 1
+        forgotten = [key for key, (evolution, _) in self.residuals.items() if self.evolutions - evolution >= self.memory]
+        for key in forgotten:
+            del self.residuals[key]
+
+    def refresh(self):
+        """Nothing to do: tiles are brought up to date when they are sampled."""
+
+    def close(self):
+        """Nothing to release: the tiles are kept in memory."""
+
+    # --- tiles ------------------------------------------------------------------
+
+    def bounds(self, index, axis):
+        start = index * self.tile
+        return start, min(start + self.tile, self.shape[axis])
+
+    def blocks(self, key, shape):
+        """Cells per row and per column of the coarse blocks covering tile ``key`` of ``shape``."""
+        rows = self.block_rows[key[0] * self.tile // self.coarse:][: -(-shape[0] // self.coarse)]
+        cols = self.block_cols[key[1] * self.tile // self.coarse:][: -(-shape[1] // self.coarse)]
+        return rows, cols
+
+    def by_block(self, values):
+        """View of a tile of whole blocks as (block row, row, block column, column), or None."""
+        a, b = values.shape
+        if a % self.coarse or b % self.coarse:
+            return None
+        return values.reshape(a // self.coarse, self.coarse, b // self.coarse, self.coarse)
+
+    def demean(self, values, key):
+        """Subtract from ``values`` (one tile) its mean over every coarse block."""
+        blocks = self.by_block(values)
+        if blocks is not None:
+            blocks -= blocks.mean(axis=(1, 3), keepdims=True)
+            return values
+        # tile on the border of the domain, with partial blocks
+        rows, cols = self.blocks(key, values.shape)
+        starts_r = np.concatenate([[0], np.cumsum(rows)[:-1]])
+        starts_c = np.concatenate([[0], np.cumsum(cols)[:-1]])
+        sums = np.add.reduceat(np.add.reduceat(values, starts_r, axis=0), starts_c, axis=1)
+        values -= np.repeat(np.repeat(sums / np.outer(rows, cols), rows, axis=0), cols, axis=1)
+        return values
+
+    def innovation(self, key, evolution):
+        """Fine detail drawn for tile ``key`` at ``evolution``, the same whenever it is drawn."""
+        shape = tuple(stop - start for start, stop in (self.bounds(key[0], 0), self.bounds(key[1], 1)))
+        return self.demean(self.stream(1, *key, evolution).standard_normal(shape), key)
+
+    def residual(self, key):
+        """Fine detail of tile ``key`` at the current evolution.
+
+        The AR(1) recursion is applied once per evolution with the innovation of
+        that evolution, also for the evolutions the tile was not sampled. A new
+        tile starts from a stationary state drawn ``memory`` evolutions ago
+        rather than from evolution 0: this is an approximation, the history it
+        replaces weighs less than ``FORGET``, so two runs with the same seed in
+        which the agents first read the tile at different times agree within
+        ``FORGET * max_power`` (typically 1e-4 of ``max_power``).
+        """
+        entry = self.residuals.get(key)
+        if entry is not None and entry[0] == self.evolutions:
+            return entry[1]
+        if entry is None:
+            evolution = max(0, self.evolutions - self.memory)
+            residual = self.innovation(key, evolution)
+        else:
+            evolution, residual = entry
+        rho = self.correlation
+        scale = math.sqrt(1 - rho ** 2)
+        for evolution in range(evolution + 1, self.evolutions + 1):
+            residual *= rho
+            residual += scale * self.innovation(key, evolution)
+        self.residuals[key] = (self.evolutions, residual)
+        return residual
+
+    def noise(self, key):
+        """White noise ``w`` of tile ``key``: block means plus fine detail."""
+        w = self.noises.get(key)
+        if w is None:
+            residual = self.residual(key)
+            rows, cols = self.blocks(key, residual.shape)
+            bi, bj = key[0] * self.tile // self.coarse, key[1] * self.tile // self.coarse
+            means = self.means[bi:bi + len(rows), bj:bj + len(cols)]
+            w = residual.copy()
+            blocks = self.by_block(w)
+            if blocks is not None:
+                blocks += means[:, np.newaxis, :, np.newaxis]
+            else:
+                w += np.repeat(np.repeat(means, rows, axis=0), cols, axis=1)
+            self.noises[key] = w
+        return w
+
+    def smoothing_matrix(self, start, stop, lo, hi, axis):
+        """Matrix applying the 1D Gaussian along ``axis`` to the cells ``lo:hi``, for the outputs ``start:stop``.
+
+        Inputs beyond the domain are reflected, like ``gaussian_filter(mode="reflect")``.
+        """
+        low_edge, high_edge = lo == 0, hi == self.shape[axis]
+        geometry = (start - lo, stop - start, hi - lo, low_edge, high_edge)
+        matrix = self.smoothing.get(geometry)
+        if matrix is None:
+            offset, size, length = geometry[:3]
+            outputs = offset + np.arange(size)[:, np.newaxis]
+            inputs = outputs + np.arange(-self.halo, self.halo + 1)
+            if low_edge:
+                inputs = np.where(inputs < 0, -inputs - 1, inputs)
+            if high_edge:
+                inputs = np.where(inputs >= length, 2 * length - inputs - 1, inputs)
+            matrix = np.zeros((size, length))
+            np.add.at(matrix, (np.broadcast_to(np.arange(size)[:, np.newaxis], inputs.shape), inputs),
+                      np.broadcast_to(self.kernel, inputs.shape))
+            matrix = self.smoothing[geometry] = matrix
+        return matrix
+
+    def field(self, key):
+        """Power of tile ``key``, smoothed with a halo from the neighboring tiles."""
+        field = self.fields.get(key)
+        if field is not None:
+            return field
+        (x0, x1), (y0, y1) = self.bounds(key[0], 0), self.bounds(key[1], 1)
+        bx0, bx1 = max(x0 - self.halo, 0), min(x1 + self.halo, self.width)
+        by0, by1 = max(y0 - self.halo, 0), min(y1 + self.halo, self.height)
+        block = np.empty((bx1 - bx0, by1 - by0))
+        for i in range(bx0 // self.tile, (bx1 - 1) // self.tile + 1):
+            tx0, tx1 = self.bounds(i, 0)
+            sx0, sx1 = max(tx0, bx0), min(tx1, bx1)
+            for j in range(by0 // self.tile, (by1 - 1) // self.tile + 1):
+                ty0, ty1 = self.bounds(j, 1)
+                sy0, sy1 = max(ty0, by0), min(ty1, by1)
+                w = self.noise((i, j))
+                block[sx0 - bx0:sx1 - bx0, sy0 - by0:sy1 - by0] = w[sx0 - tx0:sx1 - tx0, sy0 - ty0:sy1 - ty0]
+
+        # the halo covers the whole kernel: same values as filtering the whole grid
+        rows = self.smoothing_matrix(x0, x1, bx0, bx1, axis=0)
+        cols = self.smoothing_matrix(y0, y1, by0, by1, axis=1)
+        field = rows @ block @ cols.T
+        field /= self.std
+        ndtr(field, out=field)
+        field *= self.max_power
+        field = self.fields[key] = field.astype(self.dtype, copy=False)
+        return field
+
+    def values(self, ix, iy):
+        """Power at the cells (ix, iy), generating the tiles they fall in."""
+        ti, tj = ix // self.tile, iy // self.tile
+        tiles, inverse = np.unique(ti * self.tiles[1] + tj, return_inverse=True)
+        values = np.empty(len(ix))
+        for k, code in enumerate(tiles.tolist()):
+            i, j = divmod(code, self.tiles[1])
+            inside = inverse == k
+            values[inside] = self.field((i, j))[ix[inside] - i * self.tile, iy[inside] - j * self.tile]
+        return values
+
+    @property
+    def active_tiles(self):
+        """Tiles whose fine detail is currently stored."""
+        return sorted(self.residuals)
+
+    # --- sampling ---------------------------------------------------------------
+
+    def get_power_many(self, positions, out=None):
+        """Power at every row of ``positions`` (N, 2), bilinear like ``Ocean.get_power_many``."""
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        if out is None:
+            out = np.empty(len(positions), dtype=float)
+
+        x = positions[:, 1].copy()
+        y = positions[:, 0].copy()
+        x[x > self.width - 1] -= 1
+        y[y > self.height - 1] -= 1
+        x0 = np.floor(x).astype(np.intp)
+        y0 = np.floor(y).astype(np.intp)
+        x1 = np.minimum(x0 + 1, self.width - 1)
+        y1 = np.minimum(y0 + 1, self.height - 1)
+        dx = x - x0
+        dy = y - y0
+
+        # the 4 corners of every position in one pass over the tiles
+        n = len(positions)
+        corners = self.values(np.concatenate([x0, x0, x1, x1]), np.concatenate([y0, y1, y0, y1]))
+        out[:] = corners[:n] * (1 - dx) * (1 - dy)
+        out += corners[n:2 * n] * dx * (1 - dy)
+        out += corners[2 * n:3 * n] * (1 - dx) * dy
+        out += corners[3 * n:] * dx * dy
+        return out
+
+    def get_power(self, pos):
+        return self.get_power_many(np.asarray(pos, dtype=float)[np.newaxis])[0]
+
+    @property
+    def data(self):
+        """Overview of the whole field at the coarse resolution."""
+        if self.overview is None:
+            smoothed = gaussian_filter(self.means, sigma=self.sigma / self.coarse, mode="reflect", truncate=TRUNCATE)
+            self.overview = (ndtr(smoothed / self.std) * self.max_power).astype(self.dtype)
+        return self.overview
@@ -0,0 +1,137 @@
+"""Transport of the ocean and the agents to the browser.
+
+Instead of a PNG of the whole figure, the browser view (``ocean_view.vue``)
+receives:
+
+- the ocean as tiles of a mip-map pyramid (``OceanPyramid``): the level is
+  chosen so that the visible part of the ocean has about as many cells as the
+  canvas has pixels, and only the tiles in view that changed since they were
+  last sent are transmitted (``TileStream``). Cells are quantized to uint8.
+- the agents as one binary buffer of float32 positions followed by uint8
+  status codes (``encode_agents``), the codes indexing a small palette.
+
+Binary values (``bytes``) in the widget state travel as binary websocket
+buffers, not as JSON.
+"""
+
+import math
+
+import numpy as np
+from matplotlib import colormaps
+
+
+def quantize(field, max_power=1.0):
+    """``field`` in [0, max_power] as uint8 levels 0..255."""
+    scaled = np.multiply(field, 255.0 / max_power, dtype=np.float32)
+    np.clip(scaled, 0, 255, out=scaled)
+    return np.rint(scaled, out=scaled).astype(np.uint8)
+
+
+def halve(level):
+    """Mean of the 2x2 blocks of ``level`` (the last row/column repeated on odd sides)."""
+    rows, cols = level.shape
+    if rows % 2 or cols % 2:
+        level = np.pad(level, ((0, rows % 2), (0, cols % 2)), mode="edge")
+    return level.reshape(level.shape[0] // 2, 2, level.shape[1] // 2, 2).mean(axis=(1, 3), dtype=np.float32)
+
+
+class OceanPyramid:
+    """Mip-map of an ocean field, cut in square tiles.
+
+    Level 0 is the field at full resolution, every level halves both sides,
+    down to the first level that fits in a single tile. Rows of the field are
+    the y axis of the space and columns the x axis, as in ``Ocean.get_power``.
+    A cell of level 0 covers ``cell`` units of the space: 1 for an ``Ocean``,
+    the coarse block for the overview of a ``TiledOcean``.
+
+    Args:
+        field: The ocean field (``Ocean.data``)
+        max_power: Value mapped to 255 (default: 1)
+        tile: Side of the tiles in cells (default: 128)
+        cell: Side of a cell of the field in units of the space (default: 1)
+    """
+
+    def __init__(self, field, max_power=1.0, tile=128, cell=1.0):
+        self.tile = tile
+        self.cell = cell
+        self.shape = field.shape
+        level = np.asarray(field, dtype=np.float32)
+        self.levels = [quantize(level, max_power)]
+        while max(level.shape) > tile:
+            level = halve(level)
+            self.levels.append(quantize(level, max_power))
+
+    def level_for(self, view, pixels):
+        """Finest level with at most one cell per pixel of a ``pixels`` wide canvas showing ``view``."""
+        x_min, x_max, y_min, y_max = view
+        span = max(x_max - x_min, y_max - y_min, 1e-9)
+        level = math.ceil(math.log2(max(span / (pixels * self.cell), 1.0)))
+        return min(level, len(self.levels) - 1)
+
+    def tiles(self, level, view):
+        """(i, j, array) of the tiles of ``level`` that intersect ``view`` (x_min, x_max, y_min, y_max)."""
+        data = self.levels[level]
+        scale = 2 ** level * self.cell
+        x_min, x_max, y_min, y_max = view
+        # cell c of the level covers [c * scale - 0.5, (c + 1) * scale - 0.5] in space units
+        columns = self._tile_range(x_min, x_max, scale, data.shape[1])
+        rows = self._tile_range(y_min, y_max, scale, data.shape[0])
+        for i in rows:
+            for j in columns:
+                yield i, j, data[i * self.tile : (i + 1) * self.tile, j * self.tile : (j + 1) * self.tile]
+
+    def _tile_range(self, low, high, scale, cells):
+        first = max(0, math.floor((low + 0.5) / scale) // self.tile)
+        last = min(-(-cells // self.tile) - 1, math.floor((high + 0.5) / scale) // self.tile)
+        return range(first, last + 1)
+
+
+class TileStream:
+    """Tiles a browser view still needs, given what was already sent to it.
+
+    Remembers the content of every tile sent; ``update`` returns only the
+    tiles in view that are new or changed. ``reset`` forgets them, when the
+    browser lost its tiles (e.g. the view was mounted again).
+    """
+
+    def __init__(self):
+        self.sent = {}
+
+    def reset(self):
+        self.sent.clear()
+
+    def update(self, pyramid, view, pixels):
+        """Return the level to show and the list of tiles to send, as dicts for the view."""
+        level = pyramid.level_for(view, pixels)
+        tiles = []
+        for i, j, array in pyramid.tiles(level, view):
+            key = (level, i, j)
+            previous = self.sent.get(key)
+            if previous is not None and np.array_equal(previous, array):
+                continue
+            self.sent[key] = array.copy()
+            tiles.append({
+                "level": level,
+                "i": i,
+                "j": j,
+                "rows": array.shape[0],
+                "cols": array.shape[1],
+                "data": np.ascontiguousarray(array).tobytes(),
+            })
+        return level, tiles
+
+
+def colormap_table(name="inferno"):
+    """The 256 RGB colors of a matplotlib colormap, flattened, for the view to color the tiles."""
+    table = colormaps[name](np.linspace(0, 1, 256))[:, :3]
+    return [int(v) for v in np.rint(table * 255).reshape(-1)]
+
+
+def encode_agents(positions, codes):
+    """Agents as bytes: N x 2 float32 positions followed by N uint8 status codes."""
+    return np.ascontiguousarray(positions, dtype="<f4").tobytes() + np.asarray(codes, dtype=np.uint8).tobytes()
+
+
+def css_colors(palette):
+    """RGBA rows of ``palette`` as CSS colors."""
+    return [f"rgba({round(r * 255)}, {round(g * 255)}, {round(b * 255)}, {a:g})" for r, g, b, a in palette]